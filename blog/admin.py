@@ -1,7 +1,9 @@
 # Register your models here.
 
 from django.contrib import admin
-from .models import Post, Comment
+from .models import Post, Comment, Tag, RemovedComment
 
 admin.site.register(Post)
-admin.site.register(Comment)
\ No newline at end of file
+admin.site.register(Comment)
+admin.site.register(Tag)
+admin.site.register(RemovedComment)
@@ -0,0 +1,93 @@
+from functools import wraps
+
+from django.conf import settings
+from django.http import Http404, JsonResponse
+from django.views.decorators.gzip import gzip_page
+
+from mysite.conditional import conditional_for_anonymous
+from mysite.pagecache import cache_for_anonymous
+
+from .models import Comment
+from .pagination import paginate, paginate_threads, add_link_header
+from .views import published_posts, post_list_changed, post_changed
+
+# Read-only JSON API for published posts and their approved comments.
+#
+# ?fields=title,published_date picks the columns returned, and only those
+# columns are selected: rows go from values() straight to JSON without
+# building model instances. Lists are cursor paginated like the HTML pages,
+# with the next and previous page URLs in the body and the Link header.
+# Comments come a page of threads at a time, each top-level comment
+# followed by its replies, with parent_id and depth to rebuild the tree.
+
+POST_FIELDS = ('id', 'title', 'subtitle', 'excerpt', 'text', 'rendered_html', 'published_date', 'updated_date',
+               'word_count', 'reading_time', 'approved_comment_count')
+POST_LIST_FIELDS = ('id', 'title', 'subtitle', 'excerpt', 'published_date', 'reading_time', 'approved_comment_count')
+COMMENT_FIELDS = ('id', 'parent_id', 'depth', 'author', 'text', 'created_date')
+
+
+class FieldError(ValueError):
+    pass
+
+
+def requested_fields(request, allowed, default):
+    if 'fields' not in request.GET:
+        return list(default)
+    fields = [field for field in request.GET['fields'].split(',') if field]
+    unknown = [field for field in fields if field not in allowed]
+    if unknown or not fields:
+        raise FieldError('Unknown fields: %s. Choose from %s' % (', '.join(unknown) or '(none)', ', '.join(allowed)))
+    return list(dict.fromkeys(fields))
+
+
+def page_response(request, page, fields):
+    results = [{name: row[name] for name in fields} for row in page]
+    response = JsonResponse({'results': results, 'next': page.next_url, 'previous': page.previous_url})
+    return add_link_header(response, request, page)
+
+
+def page_of(request, queryset, field, fields, **kwargs):
+    # The cursor needs the sort key and id of each row, even if not asked for
+    columns = list(dict.fromkeys(fields + ['id', field]))
+    return page_response(request, paginate(request, queryset.values(*columns), field, **kwargs), fields)
+
+
+def api_view(last_changed, namespace):
+    """Gzips, answers conditional GETs, caches and reports errors as JSON."""
+    def decorator(view):
+        @wraps(view)
+        def handle_errors(request, *args, **kwargs):
+            try:
+                return view(request, *args, **kwargs)
+            except FieldError as error:
+                return JsonResponse({'error': str(error)}, status=400)
+            except Http404 as error:
+                return JsonResponse({'error': str(error)}, status=404)
+        return gzip_page(conditional_for_anonymous(last_changed)(cache_for_anonymous(namespace)(handle_errors)))
+    return decorator
+
+
+@api_view(post_list_changed, 'posts')
+def post_list(request):
+    fields = requested_fields(request, POST_FIELDS, POST_LIST_FIELDS)
+    return page_of(request, published_posts(), 'published_date', fields)
+
+
+@api_view(post_changed, 'post:{pk}')
+def post_detail(request, pk):
+    fields = requested_fields(request, POST_FIELDS, POST_FIELDS)
+    post = published_posts().filter(pk=pk).values(*fields).first()
+    if post is None:
+        raise Http404("No such post")
+    return JsonResponse(post)
+
+
+@api_view(post_changed, 'post:{pk}')
+def post_comments(request, pk):
+    fields = requested_fields(request, COMMENT_FIELDS, COMMENT_FIELDS)
+    if not published_posts().filter(pk=pk).exists():
+        raise Http404("No such post")
+    # Threads are paged on each comment's path and depth, even if not asked for
+    columns = list(dict.fromkeys(fields + ['path', 'depth']))
+    comments = Comment.objects.filter(post=pk, approved_comment=True).values(*columns)
+    return page_response(request, paginate_threads(request, comments, settings.COMMENTS_PAGE_SIZE), fields)
@@ -3,3 +3,11 @@ from django.apps import AppConfig
 
 class BlogConfig(AppConfig):
     name = 'blog'
+
+    def ready(self):
+        from mysite import pagecache
+        from . import ingest, schedule, signals  # noqa: F401
+
+        # Lists of posts change when a scheduled post's time comes
+        pagecache.expire_at('posts', schedule.next_publish_time)
+        pagecache.expire_at('sitemap-posts', schedule.next_publish_time)
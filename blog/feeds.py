@@ -0,0 +1,56 @@
+from django.conf import settings
+from django.contrib.syndication.views import Feed
+from django.db.models import Case, F, TextField, Value, When
+from django.urls import reverse
+from django.utils.feedgenerator import Atom1Feed
+
+from mysite.conditional import conditional_for_anonymous
+from mysite.pagecache import cache_for_anonymous
+
+from . import schedule
+from .rendering import render_markdown
+from .views import published_posts
+
+
+class LatestPostsFeed(Feed):
+    title = "Zenith's Blog"
+    description = "The latest posts from Zenith's Blog"
+
+    def link(self):
+        return reverse('post_list')
+
+    def items(self):
+        # Only the newest posts, and none of the columns the feed doesn't use
+        fields = ('title', 'subtitle', 'rendered_html', 'published_date', 'updated_date')
+        # The text only of posts render_posts hasn't filled in yet, in the same query
+        unrendered = Case(When(rendered_html='', then=F('text')), default=Value(''), output_field=TextField())
+        posts = published_posts().only(*fields).annotate(unrendered_text=unrendered)
+        return posts.order_by('-published_date', '-pk')[:settings.FEED_ITEM_COUNT]
+
+    def item_title(self, item):
+        return item.title
+
+    def item_description(self, item):
+        return item.rendered_html or render_markdown(item.unrendered_text)
+
+    def item_link(self, item):
+        return reverse('post_detail', kwargs={'pk': item.pk})
+
+    def item_pubdate(self, item):
+        return item.published_date
+
+    def item_updateddate(self, item):
+        return item.updated_date
+
+
+class LatestPostsAtomFeed(LatestPostsFeed):
+    feed_type = Atom1Feed
+    subtitle = LatestPostsFeed.description
+
+
+def feed_changed(request):
+    return schedule.last_changed('blog.Post')
+
+
+rss_feed = conditional_for_anonymous(feed_changed)(cache_for_anonymous('posts')(LatestPostsFeed()))
+atom_feed = conditional_for_anonymous(feed_changed)(cache_for_anonymous('posts')(LatestPostsAtomFeed()))
@@ -1,12 +1,44 @@
 from django import forms
 
-from .models import Post, Comment
+from django.utils.text import slugify
+
+from .models import Post, Comment, Tag
 
 class PostForm(forms.ModelForm):
+    tags = forms.CharField(required=False, help_text='Separate tags with commas', widget=forms.TextInput(attrs={
+        'class': 'form-control',
+        'placeholder': 'Tags'}))
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        if self.instance.pk:
+            self.initial['tags'] = ', '.join(tag.name for tag in self.instance.tags.all())
+
+    def clean_tags(self):
+        names = {}
+        for name in self.cleaned_data['tags'].split(','):
+            name = name.strip()[:Tag._meta.get_field('name').max_length]
+            if slugify(name):
+                names.setdefault(slugify(name), name)
+        return names
+
+    def _save_m2m(self):
+        super()._save_m2m()
+        tags = []
+        for slug, name in self.cleaned_data['tags'].items():
+            tag, _ = Tag.objects.get_or_create(slug=slug, defaults={'name': name})
+            tags.append(tag)
+        self.instance.tags.set(tags)
 
     class Meta:
         model = Post
-        fields = ('title', 'subtitle', 'text',)
+        fields = ('title', 'subtitle', 'text', 'published_date',)
+        labels = {
+            'published_date': 'Publish at',
+        }
+        help_texts = {
+            'published_date': 'Leave empty to keep the post as a draft, or pick a future time to schedule it',
+        }
         widgets = {
             'title': forms.TextInput(attrs={
             'class': 'form-control',
@@ -17,7 +49,10 @@ class PostForm(forms.ModelForm):
             'placeholder': 'Post Caption'}),
             'text': forms.Textarea(attrs={
             'class': 'form-control',
-            'placeholder': 'Post Text...'})
+            'placeholder': 'Post Text...'}),
+            'published_date': forms.DateTimeInput(attrs={
+            'class': 'form-control',
+            'placeholder': 'YYYY-MM-DD HH:MM'})
          }
 
 
@@ -0,0 +1,183 @@
+import atexit
+import hashlib
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.signals import request_finished
+from django.db import close_old_connections, transaction
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .models import Post, Comment
+
+# Write-behind queue for new comments.
+#
+# add_comment_to_post hands each submission to the queue and answers at
+# once. The queued comments are written with one bulk_create per batch,
+# once the oldest has waited COMMENT_QUEUE_INTERVAL seconds or as soon as
+# COMMENT_QUEUE_BATCH comments are waiting, so a burst of submissions
+# becomes a few short write transactions rather than one per request
+# contending for SQLite's lock.
+#
+# A background thread in every worker process does the writing, and the
+# worker checks again after each response it sends: servers that never run
+# threads the application starts (uWSGI without --enable-threads, as on
+# PythonAnywhere) still write comments, at the end of the worker's next
+# request once they are due.
+#
+# New comments are pending and never shown to anonymous readers, so the
+# delay is invisible to them and no cache needs invalidating. Comments
+# still queued when a worker is killed are lost; a normal exit flushes.
+#
+# Repeats of the same comment on the same post within COMMENT_DEDUP_SECONDS
+# are dropped, tracked in the cache so that all workers share them.
+
+DEDUP_KEY = 'comment-dedup:%s'
+
+logger = logging.getLogger(__name__)
+
+
+def content_hash(post_id, author, text):
+    return hashlib.sha1('\x00'.join([str(post_id), author.strip(), ' '.join(text.split())]).encode()).hexdigest()
+
+
+class CommentQueue:
+
+    def __init__(self, background=True):
+        self.background = background
+        self._items = []
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+        self._stopping = False
+        # When the oldest queued comment was submitted
+        self._since = None
+        self.flushed = 0
+        self.duplicates = 0
+        self.last_flush_size = 0
+        self.last_flush_seconds = None
+
+    def submit(self, post_id, author, text, parent=None):
+        """Queues a comment, a reply if parent is given, and returns False if it repeats a recent one."""
+        digest = content_hash(post_id, author, text)
+        if not caches[settings.PAGE_CACHE_ALIAS].add(DEDUP_KEY % digest, True, settings.COMMENT_DEDUP_SECONDS):
+            with self._lock:
+                self.duplicates += 1
+            return False
+        comment = Comment(post_id=post_id, author=author, text=text, created_date=timezone.now())
+        if parent is not None:
+            comment.parent_id, comment.depth = parent.pk, parent.depth + 1
+        with self._lock:
+            if not self._items:
+                self._since = time.monotonic()
+            self._items.append(comment)
+            depth = len(self._items)
+
+        if not settings.COMMENT_QUEUE_INTERVAL:
+            self.flush()
+        elif self.background:
+            self._ensure_thread()
+            if depth >= settings.COMMENT_QUEUE_BATCH:
+                self._wake.set()
+        return True
+
+    def flush(self):
+        """Writes every queued comment and returns how many were written."""
+        with self._flush_lock:
+            with self._lock:
+                items, self._items = self._items, []
+                since, self._since = self._since, None
+            if not items:
+                return 0
+            started = time.monotonic()
+            try:
+                # Drop comments on posts, or replies to comments, deleted while they waited
+                existing = set(Post.objects.filter(pk__in={item.post_id for item in items}).values_list('pk', flat=True))
+                items = [item for item in items if item.post_id in existing]
+                parents = {item.parent_id for item in items if item.parent_id is not None}
+                if parents:
+                    existing = set(Comment.objects.filter(pk__in=parents).values_list('pk', flat=True))
+                    items = [item for item in items if item.parent_id is None or item.parent_id in existing]
+                with transaction.atomic():
+                    for start in range(0, len(items), settings.COMMENT_QUEUE_BATCH):
+                        Comment.objects.bulk_create(items[start:start + settings.COMMENT_QUEUE_BATCH])
+                    # bulk_create doesn't give the rows their ids on SQLite, so set their paths in SQL
+                    Comment.place()
+            except Exception:
+                # Put them back to be retried with the next batch
+                with self._lock:
+                    self._items[:0] = items
+                    self._since = since
+                raise
+            self.last_flush_seconds = time.monotonic() - started
+            self.last_flush_size = len(items)
+            self.flushed += len(items)
+            return len(items)
+
+    def flush_due(self, now=None):
+        """Flushes if a full batch is waiting or the oldest comment has waited out the interval."""
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            due = len(self._items) >= settings.COMMENT_QUEUE_BATCH or (
+                bool(self._items) and now - self._since >= settings.COMMENT_QUEUE_INTERVAL)
+        return self.flush() if due else 0
+
+    def depth(self):
+        with self._lock:
+            return len(self._items)
+
+    def stats(self):
+        return {
+            'depth': self.depth(),
+            'flushed': self.flushed,
+            'duplicates': self.duplicates,
+            'last_flush_size': self.last_flush_size,
+            'last_flush_seconds': self.last_flush_seconds,
+        }
+
+    def _ensure_thread(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='comment-queue', daemon=True)
+                self._thread.start()
+                atexit.register(self.flush)
+
+    def stop(self):
+        """Stops the background thread, leaving anything still queued."""
+        with self._lock:
+            thread, self._thread = self._thread, None
+            self._stopping = thread is not None
+        if thread is not None:
+            self._wake.set()
+            thread.join()
+            self._stopping = False
+
+    def _run(self):
+        while True:
+            self._wake.wait(settings.COMMENT_QUEUE_INTERVAL)
+            self._wake.clear()
+            if self._stopping:
+                return
+            close_old_connections()
+            try:
+                self.flush()
+            except Exception:
+                logger.exception('Writing queued comments failed, %d still queued', self.depth())
+            finally:
+                close_old_connections()
+
+
+comment_queue = CommentQueue()
+
+
+@receiver(request_finished)
+def flush_due_comments(sender, **kwargs):
+    # After the response is sent, so the visitor doesn't wait for the write
+    try:
+        comment_queue.flush_due()
+    except Exception:
+        logger.exception('Writing queued comments failed, %d still queued', comment_queue.depth())
@@ -0,0 +1,16 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from blog import related
+
+
+class Command(BaseCommand):
+    help = 'Stores the most similar published posts for each post changed since the last run'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--all', action='store_true', help='Recompute every post, not just changed ones')
+
+    def handle(self, *args, **options):
+        updated = related.build(settings.RELATED_POSTS_COUNT, options['batch_size'], options['all'])
+        self.stdout.write('Updated related posts of %d posts' % updated)
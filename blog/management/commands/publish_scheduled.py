@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+from django.test import Client
+from django.urls import reverse
+
+from blog import schedule
+
+
+class Command(BaseCommand):
+    help = 'Refreshes the pages of scheduled posts whose publish time has passed'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='localhost', help='Host name the site is served under, so warmed pages match real requests')
+        parser.add_argument('--secure', action='store_true', help='Warm the https:// pages')
+        parser.add_argument('--no-warm', action='store_true', help="Don't render the refreshed pages again")
+
+    def handle(self, *args, **options):
+        pks = schedule.publish_due()
+        self.stdout.write('Published %d scheduled posts' % len(pks))
+        if not pks or options['no_warm']:
+            return
+
+        urls = [reverse('post_list'), reverse('rss_feed'), reverse('atom_feed'), reverse('sitemap_index')]
+        urls += [reverse('post_detail', kwargs={'pk': pk}) for pk in pks]
+        client = Client(HTTP_HOST=options['host'])
+        for url in urls:
+            response = client.get(url, secure=options['secure'])
+            if response.status_code != 200:
+                self.stderr.write('%s answered %d' % (url, response.status_code))
+        self.stdout.write('Warmed %d pages' % len(urls))
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from blog.models import MonthlyArchive
+
+
+class Command(BaseCommand):
+    help = 'Recounts the published posts in every month of the blog archive'
+
+    def handle(self, *args, **options):
+        months = MonthlyArchive.rebuild()
+        self.stdout.write('Counted posts in %d months' % months)
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from blog.models import Post
+
+
+class Command(BaseCommand):
+    help = 'Recalculates the approved comment count stored on every post'
+
+    def handle(self, *args, **options):
+        updated = Post.rebuild_comment_counts()
+        self.stdout.write('Rebuilt comment counts for %d posts' % updated)
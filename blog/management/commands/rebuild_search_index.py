@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from blog import search
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds the full-text search index from every post'
+
+    def handle(self, *args, **options):
+        indexed = search.rebuild_index()
+        self.stdout.write('Indexed %d posts' % indexed)
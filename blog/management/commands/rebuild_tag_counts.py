@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+
+from blog.models import Post, PostTag, Tag
+
+
+class Command(BaseCommand):
+    help = 'Recounts the published posts of every tag'
+
+    def handle(self, *args, **options):
+        PostTag.copy_published_dates(Post.objects.all())
+        tags = Tag.recount()
+        self.stdout.write('Recounted %d tags' % tags)
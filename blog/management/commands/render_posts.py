@@ -0,0 +1,40 @@
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from blog.models import Post
+from blog.rendering import RENDER_VERSION
+from home.models import LastChange
+from mysite.pagecache import invalidate
+
+
+class Command(BaseCommand):
+    help = 'Re-renders the stored HTML of posts rendered with an older Markdown configuration'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--all', action='store_true', help='Re-render every post, not just stale ones')
+
+    def handle(self, *args, **options):
+        posts = Post.objects.all()
+        if not options['all']:
+            posts = posts.exclude(render_version=RENDER_VERSION)
+        posts = posts.only('pk', 'text').order_by('pk')
+
+        last_pk, total = 0, 0
+        while True:
+            batch = list(posts.filter(pk__gt=last_pk)[:options['batch_size']])
+            if not batch:
+                break
+            now = timezone.now()
+            for post in batch:
+                post.render()
+                post.updated_date = now
+            # bulk_update sends no signals, so invalidate the cached pages here
+            Post.objects.bulk_update(batch, list(Post.RENDERED_FIELDS) + ['updated_date'])
+            invalidate(*['post:%s' % post.pk for post in batch])
+            last_pk = batch[-1].pk
+            total += len(batch)
+        if total:
+            LastChange.touch('blog.Post')
+            invalidate('posts')
+        self.stdout.write('Rendered %d posts' % total)
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from blog import spam
+
+
+class Command(BaseCommand):
+    help = 'Scores new pending comments for spam, approving clear ham and deleting clear spam'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=None)
+
+    def handle(self, *args, **options):
+        classifier = spam.train()
+        if not classifier.trained():
+            self.stdout.write('Not enough approved and removed comments to learn from yet (%d and %d)'
+                              % (classifier.ham_total, classifier.spam_total))
+            return
+        scored, approved, removed = spam.score_pending(classifier, options['batch_size'])
+        self.stdout.write('Scored %d comments, approved %d and removed %d' % (scored, approved, removed))
@@ -0,0 +1,25 @@
+# Generated by Django 2.2.28 on 2026-10-18 06:24
+
+from django.db import migrations, models
+
+
+def mark_posts_stale(apps, schema_editor):
+    # Existing rows have no excerpt yet, so let render_posts pick them all up
+    Post = apps.get_model('blog', 'Post')
+    Post.objects.update(render_version='')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0006_post_comment_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='excerpt',
+            field=models.CharField(blank=True, editable=False, max_length=300),
+        ),
+        migrations.RunPython(mark_posts_stale, migrations.RunPython.noop),
+    ]
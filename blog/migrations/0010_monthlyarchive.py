@@ -0,0 +1,37 @@
+# Generated by Django 2.2.28 on 2026-10-18 06:39
+
+from django.db import migrations, models
+from django.db.models import Count
+from django.db.models.functions import TruncMonth
+
+
+def count_months(apps, schema_editor):
+    Post = apps.get_model('blog', 'Post')
+    MonthlyArchive = apps.get_model('blog', 'MonthlyArchive')
+    months = (Post.objects.filter(published_date__isnull=False).order_by()
+              .annotate(month=TruncMonth('published_date')).values('month').annotate(total=Count('pk')))
+    MonthlyArchive.objects.bulk_create(MonthlyArchive(year=row['month'].year, month=row['month'].month, count=row['total']) for row in months)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0009_post_search_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MonthlyArchive',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('year', models.PositiveSmallIntegerField()),
+                ('month', models.PositiveSmallIntegerField()),
+                ('count', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'ordering': ('-year', '-month'),
+                'unique_together': {('year', 'month')},
+            },
+        ),
+        migrations.RunPython(count_months, migrations.RunPython.noop),
+    ]
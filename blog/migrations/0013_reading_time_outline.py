@@ -0,0 +1,35 @@
+# Generated by Django 2.2.28 on 2026-10-18 06:50
+
+from django.db import migrations, models
+
+
+def mark_posts_stale(apps, schema_editor):
+    # Existing rows have no word count or outline yet, so let render_posts pick them all up
+    Post = apps.get_model('blog', 'Post')
+    Post.objects.update(render_version='')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0012_related_posts'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='outline',
+            field=models.TextField(blank=True, editable=False),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='reading_time',
+            field=models.PositiveSmallIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='word_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(mark_posts_stale, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 2.2.28 on 2026-10-18 07:06
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0013_reading_time_outline'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RemovedComment',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('author', models.CharField(max_length=200)),
+                ('text', models.TextField()),
+                ('removed_date', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='comment',
+            name='spam_score',
+            field=models.FloatField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['approved_comment', 'spam_score'], name='blog_comment_unscored_idx'),
+        ),
+    ]
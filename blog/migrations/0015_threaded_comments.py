@@ -0,0 +1,58 @@
+# Generated by Django 2.2.28 on 2026-10-18 07:10
+
+from django.db import migrations, models
+import django.db.models.deletion
+from django.db.models.functions import Cast, LPad
+
+
+def place_comments(apps, schema_editor):
+    # Every existing comment is top level, so its path is its own id
+    Comment = apps.get_model('blog', 'Comment')
+    Comment.objects.update(path=LPad(Cast('id', models.CharField()), 10, models.Value('0')))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0014_spam_scores'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='comment',
+            name='blog_comment_post_date_idx',
+        ),
+        migrations.AddField(
+            model_name='comment',
+            name='depth',
+            field=models.PositiveSmallIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='comment',
+            name='parent',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='replies', to='blog.Comment'),
+        ),
+        migrations.AddField(
+            model_name='comment',
+            name='path',
+            field=models.CharField(default='', editable=False, max_length=255),
+        ),
+        migrations.AddField(
+            model_name='comment',
+            name='reply_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['post', 'approved_comment', 'path', 'depth'], name='blog_comment_thread_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['post', 'path', 'depth'], name='blog_comment_post_path_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(condition=models.Q(path=''), fields=['id'], name='blog_comment_unplaced_idx'),
+        ),
+        migrations.RunPython(place_comments, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 2.2.28 on 2026-10-18 07:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0015_threaded_comments'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['approved_comment', 'created_date'], name='blog_comment_pending_idx'),
+        ),
+    ]
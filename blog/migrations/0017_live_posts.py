@@ -0,0 +1,43 @@
+# Generated by Django 2.2.28 on 2026-10-18 07:24
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce, TruncMonth
+from django.utils import timezone
+
+
+def count_live_posts(apps, schema_editor):
+    # Scheduled posts were counted as soon as they were saved, so count
+    # again with only the posts whose publish time has passed.
+    Post = apps.get_model('blog', 'Post')
+    MonthlyArchive = apps.get_model('blog', 'MonthlyArchive')
+    Tag = apps.get_model('blog', 'Tag')
+    PostTag = apps.get_model('blog', 'PostTag')
+    Post.objects.filter(published_date__lte=timezone.now()).update(live=True)
+    months = (Post.objects.filter(live=True).order_by()
+              .annotate(month=TruncMonth('published_date')).values('month').annotate(total=Count('pk')))
+    MonthlyArchive.objects.all().delete()
+    MonthlyArchive.objects.bulk_create(MonthlyArchive(year=row['month'].year, month=row['month'].month, count=row['total']) for row in months)
+    live = (PostTag.objects.filter(tag=OuterRef('pk'), post__live=True)
+            .order_by().values('tag').annotate(total=Count('pk')).values('total'))
+    Tag.objects.update(post_count=Coalesce(Subquery(live), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0016_pending_comments_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='live',
+            field=models.BooleanField(default=False, editable=False),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(condition=models.Q(('live', False), ('published_date__isnull', False)), fields=['published_date'], name='blog_post_scheduled_idx'),
+        ),
+        migrations.RunPython(count_live_posts, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 2.2.28 on 2026-10-18 07:51
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0017_live_posts'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='comment',
+            name='blog_comment_visible_idx',
+        ),
+    ]
@@ -1,38 +1,353 @@
 
 # Create your models here.
+import datetime
+import json
+
 from django.conf import settings
-from django.db import models
+from django.db import models, IntegrityError, transaction
+from django.db.models import Count, F, OuterRef, Q, Subquery, DEFERRED
+from django.db.models.functions import Cast, Coalesce, Concat, LPad, TruncMonth
+from django.db.models.signals import post_save
 from django.utils import timezone
+from django.utils.text import slugify
+
+from .rendering import render_document, make_excerpt, count_words, reading_minutes, RENDER_VERSION
+
+
+class PostQuerySet(models.QuerySet):
+
+    def published(self):
+        # Posts with a future published_date are scheduled, see blog/schedule.py
+        return self.filter(published_date__lte=timezone.now())
 
 
 class Post(models.Model):
+    EXCERPT_LENGTH = 300
+    # Fields render() derives from the text
+    RENDERED_FIELDS = {'rendered_html', 'render_version', 'excerpt', 'word_count', 'reading_time', 'outline'}
+
     author = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
     title = models.CharField(max_length=200)
     subtitle = models.CharField(max_length=500)
     text = models.TextField()
     created_date = models.DateTimeField(default=timezone.now)
     published_date = models.DateTimeField(blank=True, null=True)
+    # Whether the post is counted as published, in the monthly archive and
+    # its tags' post counts. A save sets it once published_date has passed,
+    # and schedule.publish_due() when a scheduled post's time comes.
+    live = models.BooleanField(default=False, editable=False)
+    updated_date = models.DateTimeField(auto_now=True)
+    # Last time a comment visible to anonymous readers was added, changed or removed
+    comments_updated_date = models.DateTimeField(blank=True, null=True, editable=False)
+    approved_comment_count = models.PositiveIntegerField(default=0, editable=False)
+    rendered_html = models.TextField(blank=True, editable=False)
+    render_version = models.CharField(max_length=40, blank=True, editable=False)
+    excerpt = models.CharField(max_length=EXCERPT_LENGTH, blank=True, editable=False)
+    word_count = models.PositiveIntegerField(default=0, editable=False)
+    # Estimated minutes to read the post
+    reading_time = models.PositiveSmallIntegerField(default=0, editable=False)
+    # JSON list of the post's headings, see headings()
+    outline = models.TextField(blank=True, editable=False)
+    # When the build_related_posts command last stored this post's related posts
+    related_date = models.DateTimeField(blank=True, null=True, editable=False)
+    tags = models.ManyToManyField('blog.Tag', through='blog.PostTag', related_name='posts', blank=True)
+
+    objects = PostQuerySet.as_manager()
 
-    def publish(self):
-        self.published_date = timezone.now()
+    class Meta:
+        indexes = [
+            # post_list: published posts newest first
+            models.Index(fields=['published_date'], name='blog_post_published_idx', condition=Q(published_date__isnull=False)),
+            # post_draft_list: unpublished posts newest first
+            models.Index(fields=['created_date'], name='blog_post_draft_idx', condition=Q(published_date__isnull=True)),
+            # publish_due: scheduled posts not counted yet
+            models.Index(fields=['published_date'], name='blog_post_scheduled_idx', condition=Q(live=False, published_date__isnull=False)),
+        ]
+
+    # published_date and live as last loaded from or saved to the database,
+    # so a save can tell which month of the archive the post is moving out
+    # of, and whether its tags' counts change.
+    _archived_date = None
+    _was_live = False
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._archived_date = instance.__dict__.get('published_date', DEFERRED)
+        instance._was_live = instance.__dict__.get('live', DEFERRED)
+        return instance
+
+    def publish(self, when=None):
+        # A future time schedules the post, see blog/schedule.py
+        self.published_date = when or timezone.now()
         self.save()
 
+    def render(self):
+        self.rendered_html, headings = render_document(self.text)
+        self.render_version = RENDER_VERSION
+        self.excerpt = make_excerpt(self.rendered_html, self.EXCERPT_LENGTH)
+        self.word_count = count_words(self.rendered_html)
+        self.reading_time = reading_minutes(self.word_count)
+        self.outline = json.dumps(headings)
+
+    def headings(self):
+        # [{'level': 1, 'id': 'anchor', 'title': 'Heading'}, ...] in document order
+        return json.loads(self.outline) if self.outline else []
+
+    def save(self, *args, **kwargs):
+        update_fields = kwargs.get('update_fields')
+        if update_fields is None or 'text' in update_fields:
+            self.render()
+            if update_fields is not None:
+                kwargs['update_fields'] = set(update_fields) | self.RENDERED_FIELDS
+        dated = update_fields is None or 'published_date' in update_fields
+        if dated and 'published_date' in self.__dict__:
+            # A future date stays uncounted until publish_due() reaches it
+            self.live = self.published_date is not None and self.published_date <= timezone.now()
+            if update_fields is not None:
+                kwargs['update_fields'] = set(kwargs['update_fields']) | {'live'}
+        super().save(*args, **kwargs)
+        if dated:
+            self.published_date_saved()
+
+    def published_date_saved(self):
+        old, new = self._archived_date, self.__dict__.get('published_date', DEFERRED)
+        if old is DEFERRED or new is DEFERRED or self._was_live is DEFERRED:
+            return
+        counted = old if self._was_live else None
+        counting = new if self.live else None
+        if counted != counting:
+            if counted is not None:
+                MonthlyArchive.adjust(counted, -1)
+            if counting is not None:
+                MonthlyArchive.adjust(counting, 1)
+        if old != new:
+            PostTag.objects.filter(post=self).update(published_date=new)
+        if self._was_live != self.live:
+            Tag.recount(PostTag.objects.filter(post=self).values('tag'))
+        self._archived_date, self._was_live = new, self.live
+
     def __str__(self):
         return self.title
 
     def approved_comments(self):
         return self.comments.filter(approved_comment=True)
 
+    def related_posts(self):
+        return (Post.objects.filter(related_to__post=self, published_date__lte=timezone.now())
+                .only('title', 'subtitle').order_by('related_to__rank'))
+
+    def last_changed(self):
+        return max(filter(None, [self.updated_date, self.comments_updated_date]))
+
+    @classmethod
+    def rebuild_comment_counts(cls):
+        # Recount every post's approved comments in a single UPDATE.
+        approved = Comment.objects.filter(post=OuterRef('pk'), approved_comment=True).order_by().values('post').annotate(total=Count('pk')).values('total')
+        return cls.objects.update(approved_comment_count=Coalesce(Subquery(approved), 0))
+
+class MonthlyArchive(models.Model):
+    # Number of posts published in each month, in the site's time zone
+    year = models.PositiveSmallIntegerField()
+    month = models.PositiveSmallIntegerField()
+    count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        unique_together = ('year', 'month')
+        ordering = ('-year', '-month')
+
+    def __str__(self):
+        return '%d-%02d' % (self.year, self.month)
+
+    def first_day(self):
+        return datetime.date(self.year, self.month, 1)
+
+    @classmethod
+    def adjust(cls, date, delta):
+        date = timezone.localtime(date)
+        months = cls.objects.filter(year=date.year, month=date.month)
+        if months.update(count=F('count') + delta) or delta < 0:
+            return
+        try:
+            with transaction.atomic():
+                cls.objects.create(year=date.year, month=date.month, count=delta)
+        except IntegrityError:
+            # Another request created the month first
+            months.update(count=F('count') + delta)
+
+    @classmethod
+    def rebuild(cls):
+        months = (Post.objects.filter(live=True).order_by()
+                  .annotate(month=TruncMonth('published_date')).values('month').annotate(total=Count('pk')))
+        with transaction.atomic():
+            cls.objects.all().delete()
+            cls.objects.bulk_create(cls(year=row['month'].year, month=row['month'].month, count=row['total']) for row in months)
+        return cls.objects.count()
+
+class Tag(models.Model):
+    name = models.CharField(max_length=50, unique=True)
+    slug = models.SlugField(max_length=50, unique=True)
+    # Number of published posts with this tag, for the tag cloud
+    post_count = models.PositiveIntegerField(default=0, editable=False)
+
+    class Meta:
+        indexes = [
+            # Tag cloud: most used tags first
+            models.Index(fields=['post_count'], name='blog_tag_count_idx'),
+        ]
+
+    def __str__(self):
+        return self.name
+
+    def save(self, *args, **kwargs):
+        if not self.slug:
+            self.slug = slugify(self.name)
+        super().save(*args, **kwargs)
+
+    @classmethod
+    def recount(cls, tags=None):
+        # Recount the live posts of the given tags (all if None) in a single UPDATE.
+        published = (PostTag.objects.filter(tag=OuterRef('pk'), post__live=True)
+                     .order_by().values('tag').annotate(total=Count('pk')).values('total'))
+        queryset = cls.objects.all() if tags is None else cls.objects.filter(pk__in=tags)
+        return queryset.update(post_count=Coalesce(Subquery(published), 0))
+
+class PostTag(models.Model):
+    post = models.ForeignKey('blog.Post', on_delete=models.CASCADE, related_name='taggings')
+    tag = models.ForeignKey('blog.Tag', on_delete=models.CASCADE, related_name='taggings')
+    # Copy of the post's published_date, so a tag page pages through an
+    # index on this table alone instead of sorting the joined posts.
+    published_date = models.DateTimeField(blank=True, null=True, editable=False)
+
+    class Meta:
+        unique_together = ('post', 'tag')
+        indexes = [
+            # Tag pages: a tag's published posts newest first
+            models.Index(fields=['tag', 'published_date'], name='blog_posttag_tag_date_idx'),
+        ]
+
+    @classmethod
+    def copy_published_dates(cls, posts):
+        cls.objects.filter(post__in=posts).update(published_date=Subquery(Post.objects.filter(pk=OuterRef('post')).values('published_date')))
+
+class RelatedPost(models.Model):
+    # A post's nearest neighbours by text similarity, best first
+    post = models.ForeignKey('blog.Post', on_delete=models.CASCADE, related_name='+')
+    related = models.ForeignKey('blog.Post', on_delete=models.CASCADE, related_name='related_to')
+    rank = models.PositiveSmallIntegerField()
+    score = models.FloatField()
+
+    class Meta:
+        unique_together = ('post', 'rank')
+
 class Comment(models.Model):
+    # Digits of each id in a comment's path, see Comment.path
+    PATH_SEGMENT = 10
+
     post = models.ForeignKey('blog.Post', on_delete=models.CASCADE, related_name='comments')
+    parent = models.ForeignKey('self', on_delete=models.CASCADE, null=True, blank=True, related_name='replies')
     author = models.CharField(max_length=200)
     text = models.TextField()
     created_date = models.DateTimeField(default=timezone.now)
     approved_comment = models.BooleanField(default=False)
+    # Probability that the comment is spam, set by the score_comments command
+    spam_score = models.FloatField(null=True, blank=True, editable=False)
+    # The ids of the comment's ancestors and its own, zero padded and joined,
+    # so ordering by path lists each thread depth first and a comment's
+    # replies are the paths between its own and its own followed by ':'.
+    # Empty until the comment has an id, see place().
+    path = models.CharField(max_length=255, default='', editable=False)
+    depth = models.PositiveSmallIntegerField(default=0, editable=False)
+    # Number of approved comments below this one, at any depth
+    reply_count = models.PositiveIntegerField(default=0, editable=False)
+
+    class Meta:
+        indexes = [
+            # Threads shown to anonymous readers and every comment for
+            # logged in users, in path order. Depth is included so finding
+            # the top-level comments reads the index alone.
+            models.Index(fields=['post', 'approved_comment', 'path', 'depth'], name='blog_comment_thread_idx'),
+            models.Index(fields=['post', 'path', 'depth'], name='blog_comment_post_path_idx'),
+            # Pending comments on every post, newest first, for the moderation queue
+            models.Index(fields=['approved_comment', 'created_date'], name='blog_comment_pending_idx'),
+            # Pending comments not scored yet, in the order they came in
+            models.Index(fields=['approved_comment', 'spam_score'], name='blog_comment_unscored_idx'),
+            # Comments waiting for place() to set their path
+            models.Index(fields=['id'], condition=Q(path=''), name='blog_comment_unplaced_idx'),
+        ]
 
     def approve(self):
         self.approved_comment = True
-        self.save()
+        # Only the request that actually flips the row bumps the counter.
+        if Comment.objects.filter(pk=self.pk, approved_comment=False).update(approved_comment=True):
+            self.adjust_post_count(1)
+            self.adjust_ancestor_reply_counts(1)
+            post_save.send(sender=Comment, instance=self, created=False, update_fields=frozenset(['approved_comment']), raw=False, using=self._state.db)
+
+    def save(self, *args, **kwargs):
+        adding = self._state.adding
+        if adding and self.parent_id is not None:
+            self.depth = self.parent.depth + 1
+        super().save(*args, **kwargs)
+        if adding:
+            if not self.path:
+                self.path = (self.parent.path if self.parent_id is not None else '') + self.path_segment(self.pk)
+                Comment.objects.filter(pk=self.pk).update(path=self.path)
+            if self.approved_comment:
+                self.adjust_post_count(1)
+                self.adjust_ancestor_reply_counts(1)
+
+    def delete(self, *args, **kwargs):
+        # Replies are deleted with the comment, the approved ones among them
+        # are already counted in reply_count.
+        approved = self.reply_count + (1 if self.approved_comment else 0)
+        if approved:
+            self.adjust_post_count(-approved)
+            self.adjust_ancestor_reply_counts(-approved)
+        return super().delete(*args, **kwargs)
+
+    def adjust_post_count(self, delta):
+        Post.objects.filter(pk=self.post_id).update(approved_comment_count=F('approved_comment_count') + delta)
+
+    def adjust_ancestor_reply_counts(self, delta):
+        ancestors = self.ancestor_ids(self.path)
+        if ancestors:
+            Comment.objects.filter(pk__in=ancestors).update(reply_count=F('reply_count') + delta)
+
+    @classmethod
+    def path_segment(cls, pk):
+        return '%0*d' % (cls.PATH_SEGMENT, pk)
+
+    @classmethod
+    def ancestor_ids(cls, path):
+        return [int(path[start:start + cls.PATH_SEGMENT]) for start in range(0, len(path) - cls.PATH_SEGMENT, cls.PATH_SEGMENT)]
+
+    @classmethod
+    def subtree(cls, post_id, path):
+        # The comment with this path and every reply below it, as an index range
+        return Q(post=post_id, path__gte=path, path__lt=path + ':')
+
+    @classmethod
+    def place(cls):
+        # Sets the path of comments saved without one, such as those written
+        # by bulk_create, in a single UPDATE. Their parents must have paths.
+        parent_path = Subquery(cls.objects.filter(pk=OuterRef('parent')).values('path'))
+        own = LPad(Cast('id', models.CharField()), cls.PATH_SEGMENT, models.Value('0'))
+        return cls.objects.filter(path='').update(path=Concat(Coalesce(parent_path, models.Value('')), own))
+
+    def __str__(self):
+        return self.text
+
+class RemovedComment(models.Model):
+    # A comment a moderator removed, kept as a spam example for blog/spam.py
+    author = models.CharField(max_length=200)
+    text = models.TextField()
+    removed_date = models.DateTimeField(default=timezone.now)
+
+    @classmethod
+    def remember(cls, rows):
+        # Stores (author, text) pairs of removed comments in one INSERT
+        cls.objects.bulk_create(cls(author=author, text=text) for author, text in rows)
 
     def __str__(self):
-        return self.text
\ No newline at end of file
+        return self.text
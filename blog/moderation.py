@@ -0,0 +1,86 @@
+from collections import Counter
+from functools import reduce
+from operator import or_
+
+from django.db import transaction
+from django.db.models import Case, F, IntegerField, When
+
+from .models import Post, Comment, RemovedComment
+from .signals import comments_changed
+
+# Set-based moderation of many comments at once. Each action is a single
+# UPDATE or DELETE of the comments, one UPDATE of the affected posts'
+# approved_comment_count, one of their ancestors' reply_count and one round
+# of cache invalidation, instead of a save() or delete() and its signals
+# per comment.
+
+
+def add_to_column(model, column, deltas):
+    """Adds {pk: delta} to column of each row of model in one UPDATE."""
+    deltas = {pk: delta for pk, delta in deltas.items() if delta}
+    if deltas:
+        change = Case(*[When(pk=pk, then=delta) for pk, delta in deltas.items()], output_field=IntegerField())
+        model.objects.filter(pk__in=deltas).update(**{column: F(column) + change})
+
+
+def adjust_comment_counts(deltas):
+    """Adds {post pk: delta} to each post's approved_comment_count in one UPDATE."""
+    add_to_column(Post, 'approved_comment_count', deltas)
+
+
+def adjust_reply_counts(deltas):
+    """Adds {comment pk: delta} to each comment's reply_count in one UPDATE."""
+    add_to_column(Comment, 'reply_count', deltas)
+
+
+def approve(pks):
+    """Approves the pending comments among pks and returns how many."""
+    with transaction.atomic():
+        pending = Comment.objects.filter(pk__in=pks, approved_comment=False)
+        rows = list(pending.values_list('pk', 'post', 'path'))
+        approved = pending.update(approved_comment=True)
+        counts = Counter(post for pk, post, path in rows)
+        adjust_comment_counts(counts)
+        adjust_reply_counts(Counter(ancestor for pk, post, path in rows for ancestor in Comment.ancestor_ids(path)))
+        if counts:
+            comments_changed(counts)
+    return approved
+
+
+def remove(pks, remember=True):
+    """Deletes the comments among pks, with their replies, and returns how many.
+
+    Unless remember is False the chosen comments are kept as spam examples
+    for blog/spam.py to learn from; their replies are not.
+    """
+    with transaction.atomic():
+        chosen = Comment.objects.filter(pk__in=pks).values_list('pk', 'post', 'path', 'approved_comment', 'reply_count', 'author', 'text')
+        rows = sorted(chosen, key=lambda row: row[2])
+        if not rows:
+            return 0
+        if remember:
+            RemovedComment.remember((author, text) for pk, post, path, approved, replies, author, text in rows)
+
+        # Keep the top of each removed subtree, the others go with it
+        tops = []
+        for row in rows:
+            if not tops or not row[2].startswith(tops[-1][2]):
+                tops.append(row)
+        counts = Counter()
+        replies = Counter()
+        for pk, post, path, approved, reply_count, author, text in tops:
+            total = reply_count + (1 if approved else 0)
+            counts[post] -= total
+            for ancestor in Comment.ancestor_ids(path):
+                replies[ancestor] -= total
+
+        comments = Comment.objects.filter(reduce(or_, [Comment.subtree(post, path) for pk, post, path, *rest in tops]))
+        # _raw_delete skips the per-row signals that Comment.delete() and the
+        # collector would send, their work is done in bulk here instead.
+        removed = comments._raw_delete(comments.db)
+        adjust_comment_counts(counts)
+        adjust_reply_counts(replies)
+        changed = [post for post, delta in counts.items() if delta]
+        if changed:
+            comments_changed(changed)
+    return removed
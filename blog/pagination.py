@@ -0,0 +1,160 @@
+import base64
+import json
+import math
+
+from django.conf import settings
+from django.db.models import Q, Subquery, Value
+from django.db.models.functions import Coalesce
+from django.http import Http404
+from django.utils.dateparse import parse_datetime
+
+# Cursor pagination over (date field, pk). Every page is a
+# WHERE on the last row seen plus a LIMIT, so deep pages cost the same as
+# the first one, unlike OFFSET paging.
+
+NEXT = 'n'
+PREVIOUS = 'p'
+
+# Keys beyond what SQLite stores in an INTEGER can't be bound to a query
+MAX_INTEGER = 2 ** 63 - 1
+
+
+def encode_cursor(direction, value, pk):
+    # Keys are either datetimes or numbers such as a search rank
+    if hasattr(value, 'isoformat'):
+        value = value.isoformat()
+    data = json.dumps([direction, value, pk]).encode()
+    return base64.urlsafe_b64encode(data).decode().rstrip('=')
+
+
+def is_integer(value):
+    return isinstance(value, int) and not isinstance(value, bool) and -MAX_INTEGER - 1 <= value <= MAX_INTEGER
+
+
+def decode_cursor(token, numeric=False):
+    # Cursors of date keyed pages must hold a datetime, and those of
+    # number keyed pages (numeric=True) a finite number SQLite can store,
+    # or the page is a 404
+    try:
+        data = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        direction, value, pk = json.loads(data.decode())
+        if numeric:
+            valid = is_integer(value) or isinstance(value, float) and math.isfinite(value)
+        else:
+            value = parse_datetime(value) if isinstance(value, str) else None
+            valid = value is not None
+    except (ValueError, TypeError):
+        raise Http404("Invalid cursor")
+    if direction not in (NEXT, PREVIOUS) or not valid or not is_integer(pk):
+        raise Http404("Invalid cursor")
+    return direction, value, pk
+
+
+def page_url(request, cursor):
+    params = request.GET.copy()
+    params['cursor'] = cursor
+    return '%s?%s' % (request.path, params.urlencode())
+
+
+class KeysetPage:
+
+    def __init__(self, object_list, next_cursor=None, previous_cursor=None):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def link_urls(self, request):
+        self.next_url = page_url(request, self.next_cursor) if self.has_next() else None
+        self.previous_url = page_url(request, self.previous_cursor) if self.has_previous() else None
+
+
+def row_value(row, field):
+    # Rows are model instances, or values() dicts
+    return row[field] if isinstance(row, dict) else getattr(row, field)
+
+
+def row_key(row, field):
+    # values() dicts must include 'id'
+    return row_value(row, field), row_value(row, 'id')
+
+
+def paginate(request, queryset, field, per_page=None):
+    # Pages through queryset newest (largest field) first
+    per_page = per_page or settings.BLOG_PAGE_SIZE
+    token = request.GET.get('cursor')
+    direction, value, pk = decode_cursor(token) if token else (NEXT, None, None)
+
+    # Moving forwards walks towards smaller keys, moving backwards towards
+    # larger ones.
+    forwards = direction == NEXT
+    op, prefix = ('lt', '-') if forwards else ('gt', '')
+    if value is not None:
+        queryset = queryset.filter(Q(**{field + '__' + op: value}) | Q(**{field: value, 'pk__' + op: pk}))
+    rows = list(queryset.order_by(prefix + field, prefix + 'pk')[:per_page + 1])
+    extra = len(rows) > per_page
+    rows = rows[:per_page]
+    if forwards:
+        has_more, has_before = extra, value is not None
+    else:
+        has_more, has_before = True, extra
+        rows.reverse()
+
+    page = KeysetPage(rows)
+    if rows and has_more:
+        page.next_cursor = encode_cursor(NEXT, *row_key(rows[-1], field))
+    if rows and has_before:
+        page.previous_cursor = encode_cursor(PREVIOUS, *row_key(rows[0], field))
+    page.link_urls(request)
+    return page
+
+
+def paginate_threads(request, comments, per_page):
+    """Pages through comment threads, per_page top-level comments at a time.
+
+    comments are one post's comments with a path (see Comment.path), as
+    model instances or values() dicts including 'path' and 'depth'. Each
+    page is every comment from a top-level comment's path up to the next
+    page's first top-level comment, loaded with one query in path order:
+    the upper bound is a subquery on the same index. That bound is fetched
+    too, so a page holding one top-level comment more than per_page has a
+    next page, which starts after the last thread shown. The cursor is the
+    path of the last top-level comment on the page.
+    """
+    after = request.GET.get('cursor')
+    if after is not None:
+        if not after.isdigit():
+            raise Http404("Invalid cursor")
+        # Past every reply to that comment
+        comments = comments.filter(path__gt=after + ':')
+    bound = comments.filter(depth=0).order_by('path').values('path')[per_page:per_page + 1]
+    rows = list(comments.filter(path__lte=Coalesce(Subquery(bound), Value(':'))).order_by('path'))
+    tops = [row for row in rows if row_value(row, 'depth') == 0]
+    page = KeysetPage(rows)
+    if len(tops) > per_page:
+        rows.pop()
+        page.next_cursor = row_value(tops[-2], 'path')
+    page.link_urls(request)
+    return page
+
+
+def add_link_header(response, request, page):
+    links = []
+    if page.has_next():
+        links.append('<%s>; rel="next"' % page_url(request, page.next_cursor))
+    if page.has_previous():
+        links.append('<%s>; rel="prev"' % page_url(request, page.previous_cursor))
+    if links:
+        response['Link'] = ', '.join(links)
+    return response
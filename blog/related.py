@@ -0,0 +1,152 @@
+import heapq
+import math
+import re
+from collections import Counter, defaultdict
+
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from mysite.pagecache import invalidate
+
+from .models import Post, RelatedPost
+
+# Related posts, computed offline by the build_related_posts command.
+#
+# Every published post becomes a sparse TF-IDF vector over the words of its
+# title, subtitle and text, L2 normalised so a dot product is the cosine
+# similarity. Similarities are accumulated through an inverted index, so a
+# post is only ever compared with posts it shares a word with, and each
+# post's top neighbours are stored in RelatedPost for post_detail to read
+# with one indexed query.
+#
+# An incremental build recomputes the posts that changed since their
+# neighbours were stored, and offers each of them to the other posts' lists
+# using the similarities it already has. Document frequencies drift as posts
+# are added, so a full build (--all) now and then brings every score back
+# in line.
+
+WORD = re.compile(r'[^\W\d_]{3,}')
+
+STOP_WORDS = frozenset('''
+    about after again all also and any are because been before being between both but can could did does doing down
+    each few for from further had has have having her here hers him his how into its itself just more most not now
+    off once only other our ours out over own same she should some such than that the their theirs them then there
+    these they this those through too under until very was were what when where which while who whom why will with
+    would you your yours
+'''.split())
+
+# Words in more than this share of posts say little about what a post is
+# about, and would make every post a candidate neighbour of every other.
+MAX_DOCUMENT_SHARE = 0.5
+
+
+def tokenize(text):
+    return [word for word in WORD.findall(text.lower()) if word not in STOP_WORDS]
+
+
+def term_counts(posts):
+    """Returns {pk: Counter of words} for (pk, title, subtitle, text) rows."""
+    return {pk: Counter(tokenize(' '.join([title, subtitle, text]))) for pk, title, subtitle, text in posts}
+
+
+def vectorize(counts):
+    """Turns term counts into normalised TF-IDF vectors, {pk: {word: weight}}."""
+    documents = len(counts)
+    frequency = Counter(word for words in counts.values() for word in words)
+    limit = max(2, documents * MAX_DOCUMENT_SHARE)
+    idf = {word: math.log((1 + documents) / (1 + df)) + 1 for word, df in frequency.items() if df <= limit}
+
+    vectors = {}
+    for pk, words in counts.items():
+        vector = {word: (1 + math.log(count)) * idf[word] for word, count in words.items() if word in idf}
+        norm = math.sqrt(sum(weight * weight for weight in vector.values()))
+        vectors[pk] = {word: weight / norm for word, weight in vector.items()} if norm else {}
+    return vectors
+
+
+def invert(vectors):
+    index = defaultdict(list)
+    for pk, vector in vectors.items():
+        for word, weight in vector.items():
+            index[word].append((pk, weight))
+    return index
+
+
+def similarities(vector, index, pk):
+    """Returns {other pk: cosine similarity} for every post sharing a word with vector."""
+    scores = defaultdict(float)
+    for word, weight in vector.items():
+        for other, other_weight in index[word]:
+            scores[other] += weight * other_weight
+    scores.pop(pk, None)
+    return scores
+
+
+def top(scores, count):
+    return heapq.nlargest(count, ((score, pk) for pk, score in scores.items()), key=lambda pair: (pair[0], -pair[1]))
+
+
+def store(lists):
+    """Replaces the stored neighbours of each post in {pk: [(score, related pk)]}."""
+    now = timezone.now()
+    with transaction.atomic():
+        RelatedPost.objects.filter(post__in=list(lists)).delete()
+        RelatedPost.objects.bulk_create(RelatedPost(post_id=pk, related_id=related, rank=rank, score=score)
+                                        for pk, neighbours in lists.items() for rank, (score, related) in enumerate(neighbours))
+        # Stamp updated_date too, so conditional GETs of the posts see the new block
+        Post.objects.filter(pk__in=list(lists)).update(related_date=now, updated_date=now)
+    invalidate(*['post:%s' % pk for pk in lists])
+
+
+def build(count, batch_size=500, everything=False):
+    """Recomputes stored neighbours and returns the number of posts updated."""
+    posts = Post.objects.filter(published_date__isnull=False).order_by('pk')
+    vectors = vectorize(term_counts(posts.values_list('pk', 'title', 'subtitle', 'text').iterator()))
+    index = invert(vectors)
+
+    if everything:
+        changed = list(vectors)
+    else:
+        stale = posts.filter(Q(related_date__isnull=True) | Q(updated_date__gt=F('related_date')))
+        changed = [pk for pk in stale.values_list('pk', flat=True) if pk in vectors]
+    changed_set = set(changed)
+
+    offers = defaultdict(list)
+    updated = 0
+    for start in range(0, len(changed), batch_size):
+        lists = {}
+        for pk in changed[start:start + batch_size]:
+            scores = similarities(vectors[pk], index, pk)
+            lists[pk] = top(scores, count)
+            if not everything:
+                # Cosine similarity is symmetric, so these are also this
+                # post's scores in every other post's list.
+                for other, score in scores.items():
+                    if other not in changed_set:
+                        offers[other].append((score, pk))
+        store(lists)
+        updated += len(lists)
+
+    # Other posts whose lists may change: those a changed post was offered
+    # to, and those whose stored list holds a changed post's old score.
+    others = set(offers)
+    for start in range(0, len(changed), batch_size):
+        others.update(RelatedPost.objects.filter(related__in=changed[start:start + batch_size]).values_list('post', flat=True))
+    others = sorted(others - changed_set)
+    for start in range(0, len(others), batch_size):
+        batch = others[start:start + batch_size]
+        current = defaultdict(list)
+        for pk, score, related in RelatedPost.objects.filter(post__in=batch).order_by('post', 'rank').values_list('post', 'score', 'related'):
+            current[pk].append((score, related))
+        lists = {}
+        for pk in batch:
+            kept = [(score, related) for score, related in current[pk] if related not in changed_set]
+            merged = top({related: score for score, related in kept + offers[pk]}, count)
+            if merged != current[pk]:
+                lists[pk] = merged
+        if lists:
+            store(lists)
+            updated += len(lists)
+    return updated
+
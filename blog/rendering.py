@@ -0,0 +1,129 @@
+import hashlib
+import json
+import math
+import threading
+from collections import OrderedDict
+
+from html import unescape
+
+from django.conf import settings
+from django.utils.html import strip_tags
+from django.utils.text import Truncator
+
+import markdown as md
+
+MARKDOWN_EXTENSIONS = ['markdown.extensions.fenced_code', 'markdown.extensions.toc']
+
+WORDS_PER_MINUTE = 200
+
+# Stored on each post next to its rendered HTML. Changing the extensions or
+# upgrading Markdown changes the version, which marks every row as stale for
+# the render_posts command.
+RENDER_VERSION = hashlib.sha1(json.dumps([md.__version__, MARKDOWN_EXTENSIONS]).encode()).hexdigest()[:12]
+
+_local = threading.local()
+
+
+def _converter():
+    # Markdown instances are not thread safe, so each thread keeps its own
+    # and resets it between documents instead of reloading the extensions.
+    converter = getattr(_local, 'converter', None)
+    if converter is None:
+        converter = _local.converter = md.Markdown(extensions=MARKDOWN_EXTENSIONS)
+    return converter
+
+
+def render_markdown(text):
+    return _converter().reset().convert(text)
+
+
+def render_document(text):
+    """Returns the HTML for text and its headings as [{'level', 'id', 'title'}]."""
+    converter = _converter().reset()
+    html = converter.convert(text)
+    return html, list(flatten_headings(converter.toc_tokens))
+
+
+def flatten_headings(tokens):
+    for token in tokens:
+        yield {'level': token['level'], 'id': token['id'], 'title': unescape(token['name'])}
+        yield from flatten_headings(token['children'])
+
+
+def count_words(html):
+    return len(strip_tags(html).split())
+
+
+def reading_minutes(words):
+    return max(1, math.ceil(words / WORDS_PER_MINUTE))
+
+
+def make_excerpt(html, length):
+    text = ' '.join(strip_tags(html).split())
+    return Truncator(text).chars(length)
+
+
+class RenderCache:
+    """Per-process LRU of rendered HTML, capped by the bytes it holds."""
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            value = self._entries.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value):
+        cost = len(value.encode())
+        if cost > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.size -= len(old.encode())
+            self._entries[key] = value
+            self.size += cost
+            while self.size > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.size -= len(evicted.encode())
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.size = self.hits = self.misses = self.evictions = 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'bytes': self.size,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+            }
+
+
+render_cache = RenderCache(getattr(settings, 'MARKDOWN_CACHE_BYTES', 4 * 1024 * 1024))
+
+
+def render_markdown_cached(text):
+    key = hashlib.sha1((RENDER_VERSION + text).encode()).hexdigest()
+    html = render_cache.get(key)
+    if html is None:
+        html = render_markdown(text)
+        render_cache.set(key, html)
+    return html
@@ -0,0 +1,81 @@
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.utils import timezone
+
+from home.models import LastChange
+from home.sitemaps import chunk_of
+from mysite.pagecache import invalidate
+
+from .models import Post, MonthlyArchive, Tag, PostTag, RelatedPost
+
+# Scheduled publishing. A post whose published_date lies in the future
+# stays out of every public list until that moment passes, with nothing
+# written to the database when it does. So pages listing posts are cached
+# only until the next publish time, and their validators take the latest
+# publish time that has passed into account.
+#
+# Both times are kept in the cache and reloaded once the next publish time
+# passes, or whenever a post is saved.
+#
+# The publish_scheduled command, run from cron every minute or so, catches
+# up on everything else: it marks each post that went live since its last
+# run as live, which counts it in the archive and its tags, stamps it,
+# invalidates the pages that show it and renders them again.
+
+STATE_KEY = 'blog:schedule'
+
+
+def get_cache():
+    return caches[settings.PAGE_CACHE_ALIAS]
+
+
+def state():
+    """Returns {'last': latest past publish time, 'next': next future one}, either may be None."""
+    now = timezone.now()
+    times = get_cache().get(STATE_KEY)
+    if times is None or (times['next'] is not None and times['next'] <= now):
+        published = Post.objects.values_list('published_date', flat=True)
+        times = {
+            'last': published.filter(published_date__lte=now).order_by('-published_date').first(),
+            'next': published.filter(published_date__gt=now).order_by('published_date').first(),
+        }
+        get_cache().set(STATE_KEY, times, None)
+    return times
+
+
+def next_publish_time():
+    return state()['next']
+
+
+def forget():
+    # Like pagecache.invalidate, again after commit in case another request
+    # loaded the pre-commit times in between.
+    get_cache().delete(STATE_KEY)
+    transaction.on_commit(lambda: get_cache().delete(STATE_KEY))
+
+
+def last_changed(*keys):
+    """LastChange.latest(*keys), moved on to the last publish time if that is later."""
+    return max(filter(None, [LastChange.latest(*keys), state()['last']]), default=None)
+
+
+def publish_due():
+    """Marks the scheduled posts whose time has passed as live and returns their pks."""
+    now = timezone.now()
+    with transaction.atomic():
+        due = dict(Post.objects.filter(live=False, published_date__lte=now).values_list('pk', 'published_date'))
+        if not due:
+            return []
+        # update() sends no signals, so count the posts and invalidate the cached pages here
+        Post.objects.filter(pk__in=due).update(live=True, updated_date=now)
+        # Posts whose related posts now include one of them
+        listing = set(RelatedPost.objects.filter(related__in=list(due)).values_list('post', flat=True)) - set(due)
+        Post.objects.filter(pk__in=listing).update(updated_date=now)
+        for date in due.values():
+            MonthlyArchive.adjust(date, 1)
+        Tag.recount(PostTag.objects.filter(post__in=due).values('tag'))
+        LastChange.touch('blog.Post')
+        invalidate('posts', *['post:%s' % pk for pk in set(due) | listing] + ['sitemap-posts:%s' % chunk_of(pk) for pk in due])
+        forget()
+    return list(due)
@@ -0,0 +1,101 @@
+import re
+
+from django.conf import settings
+from django.db import connection
+from django.utils import timezone
+from django.utils.html import escape
+
+from .models import Post
+from .pagination import KeysetPage, decode_cursor, encode_cursor, NEXT
+
+# Full-text search over posts using an SQLite FTS5 table, blog_post_fts,
+# whose rowid is the post's id. It is kept in step with Post saves and
+# deletes by the signal receivers in blog/signals.py, and can be rebuilt in
+# one go with the rebuild_search_index command.
+
+TABLE = 'blog_post_fts'
+
+# bm25 weights for the title, subtitle and text columns
+WEIGHTS = (10.0, 5.0, 1.0)
+
+# Snippet highlight markers, swapped for <mark> tags once the snippet is escaped
+START, END = '\x02', '\x03'
+
+
+def index_post(post):
+    with connection.cursor() as cursor:
+        cursor.execute('DELETE FROM %s WHERE rowid = %%s' % TABLE, [post.pk])
+        cursor.execute('INSERT INTO %s (rowid, title, subtitle, text) VALUES (%%s, %%s, %%s, %%s)' % TABLE, [post.pk, post.title, post.subtitle, post.text])
+
+
+def remove_post(pk):
+    with connection.cursor() as cursor:
+        cursor.execute('DELETE FROM %s WHERE rowid = %%s' % TABLE, [pk])
+
+
+def rebuild_index():
+    with connection.cursor() as cursor:
+        cursor.execute('DELETE FROM %s' % TABLE)
+        cursor.execute('INSERT INTO %s (rowid, title, subtitle, text) SELECT id, title, subtitle, text FROM blog_post' % TABLE)
+        cursor.execute("INSERT INTO %s (%s) VALUES ('optimize')" % (TABLE, TABLE))
+        cursor.execute('SELECT COUNT(*) FROM %s' % TABLE)
+        return cursor.fetchone()[0]
+
+
+def match_expression(query):
+    # Quote every word so user input can't produce an FTS syntax error
+    terms = re.findall(r'\w+', query)
+    return ' '.join('"%s"' % term for term in terms)
+
+
+def highlight(snippet):
+    return escape(snippet).replace(START, '<mark>').replace(END, '</mark>')
+
+
+def search(request, query, fields, per_page=None):
+    """Returns a page of published posts matching query, best first.
+
+    Each post carries a highlighted snippet of the text that matched.
+    """
+    per_page = per_page or settings.BLOG_PAGE_SIZE
+    expression = match_expression(query)
+    if not expression:
+        return KeysetPage([])
+
+    sql = '''
+        SELECT * FROM (
+            SELECT p.id, bm25({table}, %s, %s, %s) AS rank,
+                   snippet({table}, -1, %s, %s, '…', 24) AS snippet
+            FROM {table} JOIN blog_post p ON p.id = {table}.rowid
+            WHERE {table} MATCH %s AND p.published_date <= %s
+        ) AS results
+    '''.format(table=TABLE)
+    params = list(WEIGHTS) + [START, END, expression, connection.ops.adapt_datetimefield_value(timezone.now())]
+
+    token = request.GET.get('cursor')
+    if token:
+        direction, rank, pk = decode_cursor(token, numeric=True)
+        if direction != NEXT:
+            return KeysetPage([])
+        sql += ' WHERE rank > %s OR (rank = %s AND id > %s)'
+        params += [rank, rank, pk]
+    sql += ' ORDER BY rank, id LIMIT %s'
+    params.append(per_page + 1)
+
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        columns = [column[0] for column in cursor.description]
+        rows = [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+    rows, more = rows[:per_page], len(rows) > per_page
+    posts = Post.objects.only(*fields).in_bulk([row['id'] for row in rows])
+    results = []
+    for row in rows:
+        post = posts[row['id']]
+        post.snippet = highlight(row['snippet'])
+        results.append(post)
+    page = KeysetPage(results)
+    if more:
+        page.next_cursor = encode_cursor(NEXT, rows[-1]['rank'], rows[-1]['id'])
+    page.link_urls(request)
+    return page
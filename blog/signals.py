@@ -0,0 +1,125 @@
+from django.db.models import DEFERRED
+from django.db.models.signals import post_save, post_delete, pre_delete, m2m_changed
+from django.dispatch import receiver
+from django.utils import timezone
+
+from home.models import LastChange
+from home.sitemaps import chunk_of
+from mysite.pagecache import invalidate
+
+from . import schedule, search
+from .models import Post, Comment, MonthlyArchive, Tag, PostTag, RelatedPost
+
+
+@receiver(post_save, sender=Post)
+def index_post(sender, instance, **kwargs):
+    search.index_post(instance)
+
+
+@receiver(post_delete, sender=Post)
+def unindex_post(sender, instance, **kwargs):
+    search.remove_post(instance.pk)
+
+
+@receiver(post_delete, sender=Post)
+def remove_from_archive(sender, instance, **kwargs):
+    # Also covers queryset deletes, which skip Post.delete()
+    if instance._was_live is True and instance._archived_date not in (None, DEFERRED):
+        MonthlyArchive.adjust(instance._archived_date, -1)
+
+
+@receiver([post_save, post_delete], sender=Post)
+def invalidate_post_pages(sender, instance, **kwargs):
+    schedule.forget()
+    LastChange.touch('blog.Post')
+    invalidate('posts', 'post:%s' % instance.pk, 'sitemap-posts:%s' % chunk_of(instance.pk))
+
+
+def touch_posts(post_ids):
+    # Stamps and invalidates posts whose tags or related posts changed
+    # without a Post save. The new updated_date also has the next
+    # incremental build_related_posts recompute their neighbours.
+    if not post_ids:
+        return
+    Post.objects.filter(pk__in=post_ids).update(updated_date=timezone.now())
+    LastChange.touch('blog.Post')
+    invalidate('posts', *['post:%s' % pk for pk in post_ids])
+
+
+def listing_posts(post):
+    # Posts showing post's title and link among their related posts
+    return list(RelatedPost.objects.filter(related=post).values_list('post', flat=True))
+
+
+@receiver(post_save, sender=Post)
+def touch_listing_posts(sender, instance, update_fields=None, **kwargs):
+    # Related posts show the title and subtitle of published posts only
+    if update_fields is None or {'title', 'subtitle', 'published_date'} & set(update_fields):
+        touch_posts(listing_posts(instance))
+
+
+@receiver(pre_delete, sender=Post)
+def remember_listing_posts(sender, instance, **kwargs):
+    # Their RelatedPost rows are deleted along with the post
+    instance._listing_post_ids = listing_posts(instance)
+
+
+@receiver(post_delete, sender=Post)
+def touch_posts_that_listed(sender, instance, **kwargs):
+    touch_posts(instance.__dict__.get('_listing_post_ids'))
+
+
+@receiver(m2m_changed, sender=Post.tags.through)
+def retag_posts(sender, instance, action, reverse, pk_set, **kwargs):
+    if action == 'pre_clear':
+        # pk_set is None for clears, so remember what is being removed
+        related = instance.posts if reverse else instance.tags
+        instance._cleared_pks = set(related.values_list('pk', flat=True))
+        return
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if action == 'post_clear':
+        pk_set = instance.__dict__.pop('_cleared_pks', set())
+    post_ids, tag_ids = (pk_set, [instance.pk]) if reverse else ([instance.pk], pk_set)
+    if action == 'post_add':
+        PostTag.copy_published_dates(post_ids)
+    Tag.recount(tag_ids)
+    touch_posts(post_ids)
+
+
+@receiver(pre_delete, sender=Post)
+def remember_tags(sender, instance, **kwargs):
+    # The post's tag links are deleted without an m2m_changed signal
+    instance._deleted_tag_ids = list(instance.tags.values_list('pk', flat=True))
+
+
+@receiver(post_delete, sender=Post)
+def recount_tags(sender, instance, **kwargs):
+    if instance.__dict__.get('_deleted_tag_ids'):
+        Tag.recount(instance._deleted_tag_ids)
+
+
+@receiver(post_save, sender=Tag)
+def rename_tag(sender, instance, created, **kwargs):
+    if not created:
+        touch_posts(list(instance.posts.values_list('pk', flat=True)))
+
+
+@receiver(pre_delete, sender=Tag)
+def delete_tag(sender, instance, **kwargs):
+    touch_posts(list(instance.posts.values_list('pk', flat=True)))
+
+
+@receiver([post_save, post_delete], sender=Comment)
+def invalidate_comment_pages(sender, instance, **kwargs):
+    # Pending comments never appear on cached (anonymous) pages
+    if instance.approved_comment:
+        comments_changed([instance.post_id])
+
+
+def comments_changed(post_ids):
+    # Stamps and invalidates posts whose visible comments changed
+    post_ids = set(post_ids)
+    Post.objects.filter(pk__in=post_ids).update(comments_updated_date=timezone.now())
+    LastChange.touch('blog.Comment')
+    invalidate('posts', *['post:%s' % pk for pk in post_ids] + ['sitemap-posts:%s' % chunk_of(pk) for pk in post_ids])
@@ -0,0 +1,123 @@
+import math
+import re
+from collections import Counter
+
+from django.conf import settings
+from django.db.models import Q
+
+from . import moderation
+from .models import Comment, RemovedComment
+
+# Spam scoring for pending comments, run offline by the score_comments command.
+#
+# A naive Bayes classifier is trained from the comments moderators approved
+# (ham) and removed (spam, kept in RemovedComment). Each distinct token of a
+# comment adds its log likelihood ratio to the prior log odds, and the sum
+# is turned back into a probability stored on the comment as spam_score.
+#
+# Comments are scored in batches: one query reads a batch, one UPDATE stores
+# its scores, and the confident ones are approved or purged together with
+# blog.moderation, so a flood of comments costs a few statements per batch.
+# Comments the classifier approves are left out of later training, and
+# those it purges are not remembered as examples, so it never learns from
+# its own verdicts.
+
+TOKEN = re.compile(r"[^\W_]{2,}|[$!]+", re.UNICODE)
+LINK = re.compile(r'https?://([^/\s]+)', re.IGNORECASE)
+
+# Log odds beyond this saturate the probability anyway
+MAX_LOG_ODDS = 50
+
+
+def tokenize(author, text):
+    tokens = set(TOKEN.findall(text.lower()))
+    # Link hosts and the author say a lot about spam, keep them apart from words
+    tokens.update('host:' + host for host in LINK.findall(text.lower()))
+    tokens.add('author:' + author.strip().lower())
+    return tokens
+
+
+class Classifier:
+
+    def __init__(self, ham, spam):
+        """Trains from iterables of (author, text) pairs."""
+        ham_counts, self.ham_total = self.count(ham)
+        spam_counts, self.spam_total = self.count(spam)
+        # Laplace smoothing, so a token seen in one class only isn't infinitely telling
+        ham_scale = math.log(self.ham_total + 2)
+        spam_scale = math.log(self.spam_total + 2)
+        self.weights = {token: math.log(spam_counts[token] + 1) - spam_scale - math.log(ham_counts[token] + 1) + ham_scale
+                        for token in ham_counts.keys() | spam_counts.keys()}
+        self.prior = math.log(self.spam_total + 1) - math.log(self.ham_total + 1)
+
+    @staticmethod
+    def count(rows):
+        counts = Counter()
+        total = 0
+        for author, text in rows:
+            counts.update(tokenize(author, text))
+            total += 1
+        return counts, total
+
+    def trained(self):
+        return min(self.ham_total, self.spam_total) >= settings.SPAM_MIN_EXAMPLES
+
+    def score(self, author, text):
+        weights = self.weights
+        log_odds = self.prior + sum(weights.get(token, 0.0) for token in tokenize(author, text))
+        log_odds = max(-MAX_LOG_ODDS, min(MAX_LOG_ODDS, log_odds))
+        return 1 / (1 + math.exp(-log_odds))
+
+    def score_many(self, rows):
+        """Returns {pk: spam probability} for (pk, author, text) rows."""
+        return {pk: self.score(author, text) for pk, author, text in rows}
+
+
+def training_ham():
+    # Approved by a moderator: before scoring existed, or despite an unsure score
+    approved = Comment.objects.filter(approved_comment=True)
+    approved = approved.filter(Q(spam_score__isnull=True) | Q(spam_score__gt=settings.SPAM_APPROVE_SCORE))
+    return approved.order_by('-pk').values_list('author', 'text')[:settings.SPAM_TRAINING_SIZE]
+
+
+def training_spam():
+    return RemovedComment.objects.order_by('-pk').values_list('author', 'text')[:settings.SPAM_TRAINING_SIZE]
+
+
+def train():
+    return Classifier(training_ham().iterator(), training_spam().iterator())
+
+
+def store_scores(scores):
+    comments = [Comment(pk=pk, spam_score=score) for pk, score in scores.items()]
+    Comment.objects.bulk_update(comments, ['spam_score'], batch_size=settings.SPAM_BATCH_SIZE)
+
+
+def score_pending(classifier=None, batch_size=None):
+    """Scores every unscored pending comment and acts on the confident ones.
+
+    Returns (scored, approved, removed). Nothing is scored while either class
+    has fewer than SPAM_MIN_EXAMPLES examples to learn from.
+    """
+    classifier = classifier or train()
+    if not classifier.trained():
+        return 0, 0, 0
+    batch_size = batch_size or settings.SPAM_BATCH_SIZE
+    unscored = Comment.objects.filter(approved_comment=False, spam_score__isnull=True).order_by('pk')
+    scored = approved = removed = 0
+    last = 0
+    while True:
+        rows = list(unscored.filter(pk__gt=last).values_list('pk', 'author', 'text')[:batch_size])
+        if not rows:
+            break
+        last = rows[-1][0]
+        scores = classifier.score_many(rows)
+        store_scores(scores)
+        scored += len(scores)
+        ham = [pk for pk, score in scores.items() if score <= settings.SPAM_APPROVE_SCORE]
+        spam = [pk for pk, score in scores.items() if score >= settings.SPAM_REMOVE_SCORE]
+        if ham:
+            approved += moderation.approve(ham)
+        if spam:
+            removed += moderation.remove(spam, remember=False)
+    return scored, approved, removed
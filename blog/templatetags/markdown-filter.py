@@ -1,7 +1,7 @@
 from django import template
 from django.template.defaultfilters import stringfilter
 
-import markdown as md
+from blog.rendering import render_markdown_cached
 
 register = template.Library()
 
@@ -9,4 +9,4 @@ register = template.Library()
 @register.filter()
 @stringfilter
 def markdown(text):
-    return md.markdown(text, extensions=['markdown.extensions.fenced_code'])
\ No newline at end of file
+    return render_markdown_cached(text)
@@ -1,12 +1,35 @@
-from django.urls import resolve
-from django.test import TestCase
+from io import StringIO
+import datetime
+import time
+from datetime import timedelta
+from importlib import import_module
+from unittest import mock
+
+import markdown
+
+from django.conf import settings
+from django.urls import resolve, reverse
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from django.core.cache import cache
+from django.db import connection
+from django.core.management import call_command
 from django.http import HttpRequest
+from django.test import RequestFactory
 from django.contrib.auth.models import User
 
-from blog.views import post_list, post_detail, post_new, post_edit, post_draft_list, post_publish, post_remove, add_comment_to_post, comment_approve, comment_remove
-from blog.models import Post, Comment  
+from blog.views import post_list, post_detail, post_new, post_edit, post_draft_list, post_publish, post_remove, add_comment_to_post, comment_approve, comment_remove, post_search
+from blog.models import Post, Comment, MonthlyArchive, Tag, RemovedComment
+from blog import api, moderation, rendering, related, schedule, spam
+from blog.pagination import encode_cursor, paginate_threads
+from blog.ingest import CommentQueue
+from mysite import pagecache, ratelimit
+from blog.rendering import RENDER_VERSION, render_markdown
 from .forms import PostForm, CommentForm
 
+markdown_filter = import_module('blog.templatetags.markdown-filter').markdown
+
 class PostListTest(TestCase):
 
     def setUp(self):
@@ -768,3 +791,1590 @@ class AuthenticationTest(TestCase):
         self.assertIn('<a class="btn btn-outline-dark" href="/blog/comment/'+ str(comment.pk) +'/remove/">Delete</span></a>', html)
         self.client.logout()
 
+
+
+class CommentCountTest(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user('temporary', 'temporary@gmail.com', 'temporary')
+        self.post = Post.objects.create(author=self.user, title="Count Post", subtitle="Count Subtitle", text="Count Text")
+
+    def tearDown(self):
+        self.user.delete()
+
+    def create_posts(self, count, published=True):
+        for i in range(count):
+            post = Post.objects.create(author=self.user, title="Post " + str(i), subtitle="Subtitle", text="Text")
+            if published:
+                post.publish()
+            Comment.objects.create(post=post, author="Author", text="Text", approved_comment=True)
+
+    def test_new_comment_not_counted_until_approved(self):
+        comment = Comment.objects.create(post=self.post, author="Author 1", text="Text 1")
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.approved_comment_count, 0)
+        comment.approve()
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.approved_comment_count, 1)
+
+    def test_approving_twice_counts_once(self):
+        comment = Comment.objects.create(post=self.post, author="Author 2", text="Text 2")
+        comment.approve()
+        Comment.objects.get(pk=comment.pk).approve()
+        stale = Comment.objects.get(pk=comment.pk)
+        stale.approved_comment = False
+        stale.approve()
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.approved_comment_count, 1)
+
+    def test_approved_comment_created_directly_is_counted(self):
+        Comment.objects.create(post=self.post, author="Author 3", text="Text 3", approved_comment=True)
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.approved_comment_count, 1)
+
+    def test_comment_remove_decrements_count(self):
+        self.client.login(username='temporary', password='temporary')
+        approved = Comment.objects.create(post=self.post, author="Author 4", text="Text 4", approved_comment=True)
+        pending = Comment.objects.create(post=self.post, author="Author 5", text="Text 5")
+        self.client.get("/blog/comment/" + str(pending.pk) + "/remove/")
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.approved_comment_count, 1)
+        self.client.get("/blog/comment/" + str(approved.pk) + "/remove/")
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.approved_comment_count, 0)
+        self.client.logout()
+
+    def test_rebuild_comment_counts_command(self):
+        Comment.objects.create(post=self.post, author="Author 6", text="Text 6", approved_comment=True)
+        Comment.objects.create(post=self.post, author="Author 7", text="Text 7", approved_comment=True)
+        Comment.objects.create(post=self.post, author="Author 8", text="Text 8")
+        Post.objects.update(approved_comment_count=42)
+        call_command('rebuild_comment_counts', stdout=StringIO())
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.approved_comment_count, 2)
+
+    def test_post_list_shows_stored_count(self):
+        self.post.publish()
+        Comment.objects.create(post=self.post, author="Author 9", text="Text 9", approved_comment=True)
+        response = self.client.get('/blog/')
+        self.assertContains(response, 'Comments: 1</a>')
+
+    def test_post_list_query_count_is_constant(self):
+        # The conditional GET validators, the publish schedule (reloaded
+        # after a post is saved), the posts, their tags, the archive sidebar
+        # and the tag cloud
+        self.create_posts(1)
+        with self.assertNumQueries(7):
+            self.client.get('/blog/')
+        self.create_posts(10)
+        for post in Post.objects.all():
+            post.tags.add(Tag.objects.get_or_create(name="Shared")[0], Tag.objects.create(name="Own " + str(post.pk)))
+        with self.assertNumQueries(7):
+            self.client.get('/blog/')
+        with self.assertNumQueries(5):
+            self.client.get('/blog/')
+
+    def test_draft_list_query_count_is_constant(self):
+        self.client.login(username='temporary', password='temporary')
+        self.create_posts(1, published=False)
+        with self.assertNumQueries(4):
+            self.client.get('/blog/drafts/')
+        self.create_posts(10, published=False)
+        with self.assertNumQueries(4):
+            self.client.get('/blog/drafts/')
+        self.client.logout()
+
+
+@override_settings(BLOG_PAGE_SIZE=2)
+class KeysetPaginationTest(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user('temporary', 'temporary@gmail.com', 'temporary')
+        now = timezone.now()
+        self.posts = []
+        for i in range(5):
+            post = Post.objects.create(author=self.user, title="Paged Post " + str(i), subtitle="Subtitle", text="Text")
+            # Two posts share a timestamp so the pk tiebreak is exercised
+            post.published_date = now - timedelta(days=min(i, 3))
+            post.created_date = post.published_date
+            post.save()
+            self.posts.append(post)
+
+    def tearDown(self):
+        self.user.delete()
+
+    def titles(self, response):
+        return [post.title for post in response.context['posts']]
+
+    def test_first_page(self):
+        response = self.client.get('/blog/')
+        self.assertEqual(self.titles(response), ["Paged Post 0", "Paged Post 1"])
+        self.assertFalse(response.context['page'].has_previous())
+        self.assertIn('rel="next"', response['Link'])
+        self.assertNotIn('rel="prev"', response['Link'])
+
+    def test_walk_forwards_and_back(self):
+        response = self.client.get('/blog/')
+        seen = self.titles(response)
+        while response.context['page'].has_next():
+            response = self.client.get('/blog/?cursor=' + response.context['page'].next_cursor)
+            seen += self.titles(response)
+        self.assertEqual(seen, ["Paged Post " + str(i) for i in [0, 1, 2, 4, 3]])
+        self.assertNotIn('rel="next"', response['Link'])
+        response = self.client.get('/blog/?cursor=' + response.context['page'].previous_cursor)
+        self.assertEqual(self.titles(response), ["Paged Post 2", "Paged Post 4"])
+        response = self.client.get('/blog/?cursor=' + response.context['page'].previous_cursor)
+        self.assertEqual(self.titles(response), ["Paged Post 0", "Paged Post 1"])
+        self.assertFalse(response.context['page'].has_previous())
+
+    def test_drafts_paginate_on_created_date(self):
+        Post.objects.update(published_date=None)
+        self.client.login(username='temporary', password='temporary')
+        response = self.client.get('/blog/drafts/')
+        self.assertEqual(self.titles(response), ["Paged Post 0", "Paged Post 1"])
+        self.assertContains(response, 'id="older-posts"')
+        self.client.logout()
+
+    def test_invalid_cursor_404(self):
+        response = self.client.get('/blog/?cursor=not-a-cursor')
+        self.assertEqual(response.status_code, 404)
+
+    def test_cursor_value_of_the_wrong_type_404(self):
+        number = encode_cursor('n', 5, 1)
+        self.assertEqual(self.client.get('/blog/?cursor=' + number).status_code, 404)
+        self.assertEqual(self.client.get('/blog/api/posts/?cursor=' + number).status_code, 404)
+        date = encode_cursor('n', timezone.now(), 1)
+        self.assertEqual(self.client.get('/blog/search/?q=post&cursor=' + date).status_code, 404)
+        self.assertEqual(self.client.get('/blog/search/?q=post&cursor=' + encode_cursor('n', 5, 1)).status_code, 200)
+        huge = encode_cursor('n', timezone.now(), 10 ** 30)
+        self.assertEqual(self.client.get('/blog/?cursor=' + huge).status_code, 404)
+        self.assertEqual(self.client.get('/blog/api/posts/?cursor=' + huge).status_code, 404)
+        for value, pk in [(10 ** 400, 1), (1.5, 10 ** 30), (float('inf'), 1)]:
+            self.assertEqual(self.client.get('/blog/search/?q=post&cursor=' + encode_cursor('n', value, pk)).status_code, 404)
+        self.client.login(username='temporary', password='temporary')
+        self.assertEqual(self.client.get('/blog/comments/pending/?cursor=' + huge).status_code, 404)
+        self.client.logout()
+
+
+class RenderedHtmlTest(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user('temporary', 'temporary@gmail.com', 'temporary')
+        self.client.login(username='temporary', password='temporary')
+
+    def tearDown(self):
+        self.client.logout()
+        self.user.delete()
+
+    def test_post_new_stores_rendered_html(self):
+        data={'title':"Rendered 1", 'subtitle':"Subtitle", 'text':"# Heading\n\n```\ncode\n```",}
+        self.client.post('/blog/post/new/', data)
+        post = Post.objects.first()
+        self.assertIn('<h1 id="heading">Heading</h1>', post.rendered_html)
+        self.assertIn('<pre><code>code', post.rendered_html)
+        self.assertEqual(post.render_version, RENDER_VERSION)
+
+    def test_post_edit_rerenders(self):
+        self.client.post('/blog/post/new/', {'title':"Rendered 2", 'subtitle':"Subtitle", 'text':"*old*",})
+        post = Post.objects.first()
+        self.client.post('/blog/post/' + str(post.pk) + '/edit/', {'title':"Rendered 2", 'subtitle':"Subtitle", 'text':"**new**",})
+        post.refresh_from_db()
+        self.assertIn('<strong>new</strong>', post.rendered_html)
+
+    def test_post_detail_uses_stored_html(self):
+        post = Post.objects.create(author=self.user, title="Rendered 3", subtitle="Subtitle", text="Text")
+        Post.objects.filter(pk=post.pk).update(rendered_html='<em>stored</em>')
+        response = self.client.get('/blog/post/' + str(post.pk) + '/')
+        self.assertContains(response, '<em>stored</em>')
+
+    def test_save_stores_word_count_reading_time_and_outline(self):
+        text = "# Intro\n\n" + "word " * 450 + "\n\n## Tom &amp; Jerry\n\nMore\n\n# Intro"
+        self.client.post('/blog/post/new/', {'title':"Outlined", 'subtitle':"Subtitle", 'text':text,})
+        post = Post.objects.first()
+        self.assertEqual(post.word_count, 456)
+        self.assertEqual(post.reading_time, 3)
+        self.assertEqual(post.headings(), [
+            {'level': 1, 'id': 'intro', 'title': "Intro"},
+            {'level': 2, 'id': 'tom-jerry', 'title': "Tom & Jerry"},
+            {'level': 1, 'id': 'intro_1', 'title': "Intro"},
+        ])
+        response = self.client.get('/blog/post/' + str(post.pk) + '/')
+        self.assertContains(response, '<a href="#tom-jerry">Tom &amp; Jerry</a>')
+        self.assertContains(response, '456 words · 3 min read')
+
+    def test_partial_save_of_text_updates_reading_time(self):
+        post = Post.objects.create(author=self.user, title="Partial", subtitle="Subtitle", text="Short")
+        post.text = "word " * 201
+        post.save(update_fields=['text'])
+        post.refresh_from_db()
+        self.assertEqual((post.word_count, post.reading_time), (201, 2))
+
+    def test_render_posts_backfills_reading_time(self):
+        post = Post.objects.create(author=self.user, title="Backfill", subtitle="Subtitle", text="## Only heading\n\nSome words here")
+        post.publish()
+        Post.objects.filter(pk=post.pk).update(word_count=0, reading_time=0, outline='', render_version='')
+        call_command('render_posts', stdout=StringIO())
+        post.refresh_from_db()
+        self.assertEqual((post.word_count, post.reading_time), (5, 1))
+        self.assertEqual(post.headings(), [{'level': 2, 'id': 'only-heading', 'title': "Only heading"}])
+        self.assertContains(self.client.get('/blog/'), '1 min read')
+
+    def test_render_posts_only_touches_stale_rows(self):
+        fresh = Post.objects.create(author=self.user, title="Fresh", subtitle="Subtitle", text="*fresh*")
+        stale = Post.objects.create(author=self.user, title="Stale", subtitle="Subtitle", text="*stale*")
+        Post.objects.filter(pk=fresh.pk).update(rendered_html='untouched')
+        Post.objects.filter(pk=stale.pk).update(rendered_html='', render_version='old')
+        out = StringIO()
+        call_command('render_posts', batch_size=1, stdout=out)
+        fresh.refresh_from_db()
+        stale.refresh_from_db()
+        self.assertEqual(fresh.rendered_html, 'untouched')
+        self.assertIn('<em>stale</em>', stale.rendered_html)
+        self.assertEqual(stale.render_version, RENDER_VERSION)
+        self.assertIn('Rendered 1 posts', out.getvalue())
+
+
+class MarkdownCacheTest(TestCase):
+
+    def test_converter_is_reused(self):
+        first = rendering._converter()
+        render_markdown("# One")
+        self.assertIs(rendering._converter(), first)
+        self.assertEqual(render_markdown("```\ncode\n```"), markdown.markdown("```\ncode\n```", extensions=rendering.MARKDOWN_EXTENSIONS))
+
+    def test_filter_hits_cache_on_repeat(self):
+        rendering.render_cache.clear()
+        first = markdown_filter("*cached*")
+        second = markdown_filter("*cached*")
+        self.assertEqual(first, second)
+        stats = rendering.render_cache.stats()
+        self.assertEqual(stats['misses'], 1)
+        self.assertEqual(stats['hits'], 1)
+        self.assertEqual(stats['entries'], 1)
+
+    def test_stats_endpoint_needs_login(self):
+        self.assertEqual(self.client.get('/blog/render-cache/').status_code, 302)
+        user = User.objects.create_user('stats', 'stats@gmail.com', 'stats')
+        self.client.login(username='stats', password='stats')
+        rendering.render_cache.clear()
+        markdown_filter("*counted*")
+        stats = self.client.get('/blog/render-cache/').json()
+        self.assertEqual((stats['misses'], stats['entries']), (1, 1))
+        self.assertIn('evictions', stats)
+        self.client.logout()
+        user.delete()
+
+    def test_lru_evicts_by_bytes(self):
+        cache = rendering.RenderCache(max_bytes=10)
+        cache.set('a', '1234')
+        cache.set('b', '1234')
+        cache.get('a')
+        cache.set('c', '1234')
+        self.assertEqual(cache.get('b'), None)
+        self.assertEqual(cache.get('a'), '1234')
+        self.assertEqual(cache.get('c'), '1234')
+        self.assertEqual(cache.stats()['evictions'], 1)
+        self.assertEqual(cache.stats()['bytes'], 8)
+
+    def test_oversized_value_not_cached(self):
+        cache = rendering.RenderCache(max_bytes=3)
+        cache.set('a', '1234')
+        self.assertEqual(cache.stats()['entries'], 0)
+
+
+@override_settings(COMMENTS_PAGE_SIZE=2)
+class CommentPaginationTest(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user('temporary', 'temporary@gmail.com', 'temporary')
+        self.post = Post.objects.create(author=self.user, title="Comment Page", subtitle="Subtitle", text="Text")
+        self.post.publish()
+        for i in range(3):
+            Comment.objects.create(post=self.post, author="Approved " + str(i), text="Text", approved_comment=True)
+        Comment.objects.create(post=self.post, author="Pending", text="Spam")
+
+    def tearDown(self):
+        self.user.delete()
+
+    def authors(self, response):
+        return [comment.author for comment in response.context['comments']]
+
+    def test_anonymous_only_loads_approved(self):
+        response = self.client.get('/blog/post/' + str(self.post.pk) + '/')
+        self.assertEqual(self.authors(response), ["Approved 0", "Approved 1"])
+        self.assertNotContains(response, "Pending")
+        response = self.client.get(reverse('post_comments', kwargs={'pk': self.post.pk}) + '?cursor=' + response.context['comments'].next_cursor)
+        self.assertEqual(self.authors(response), ["Approved 2"])
+        self.assertFalse(response.context['comments'].has_next())
+
+    def test_authenticated_sees_pending(self):
+        self.client.login(username='temporary', password='temporary')
+        response = self.client.get('/blog/post/' + str(self.post.pk) + '/')
+        url = reverse('post_comments', kwargs={'pk': self.post.pk}) + '?cursor=' + response.context['comments'].next_cursor
+        self.assertContains(response, 'id="more-comments" href="' + url + '"')
+        response = self.client.get(url)
+        self.assertEqual(self.authors(response), ["Approved 2", "Pending"])
+        self.client.logout()
+
+    def test_fragment_is_not_a_full_page(self):
+        response = self.client.get(reverse('post_comments', kwargs={'pk': self.post.pk}))
+        self.assertTemplateUsed(response, 'includes/comments.html')
+        self.assertNotContains(response, '<html>')
+
+    def test_no_comments_message(self):
+        Comment.objects.all().delete()
+        response = self.client.get('/blog/post/' + str(self.post.pk) + '/')
+        self.assertContains(response, 'No comments, be the first!')
+
+
+class ExcerptTest(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user('temporary', 'temporary@gmail.com', 'temporary')
+
+    def tearDown(self):
+        self.user.delete()
+
+    def test_excerpt_is_plain_text(self):
+        post = Post.objects.create(author=self.user, title="Excerpt 1", subtitle="Subtitle", text="# Heading\n\nSome **bold**\ntext.")
+        self.assertEqual(post.excerpt, "Heading Some bold text.")
+
+    def test_excerpt_is_truncated(self):
+        post = Post.objects.create(author=self.user, title="Excerpt 2", subtitle="Subtitle", text="word " * 200)
+        self.assertEqual(len(post.excerpt), Post.EXCERPT_LENGTH)
+        self.assertTrue(post.excerpt.endswith('…'))
+
+    def test_list_views_defer_body(self):
+        post = Post.objects.create(author=self.user, title="Excerpt 3", subtitle="Subtitle", text="Body *text*")
+        post.publish()
+        response = self.client.get('/blog/')
+        card = list(response.context['posts'])[0]
+        self.assertIn('text', card.get_deferred_fields())
+        self.assertIn('rendered_html', card.get_deferred_fields())
+        self.assertContains(response, '<p class="excerpt card-text">Body text</p>')
+        self.client.login(username='temporary', password='temporary')
+        Post.objects.update(published_date=None)
+        response = self.client.get('/blog/drafts/')
+        self.assertIn('text', list(response.context['posts'])[0].get_deferred_fields())
+        self.client.logout()
+
+
+@override_settings(PAGE_CACHE_TIMEOUT=60)
+class PageCacheTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('temporary', 'temporary@gmail.com', 'temporary')
+        self.post = Post.objects.create(author=self.user, title="Cached Post", subtitle="Subtitle", text="Text")
+        self.post.publish()
+        self.other = Post.objects.create(author=self.user, title="Other Post", subtitle="Subtitle", text="Text")
+        self.other.publish()
+
+    def tearDown(self):
+        self.user.delete()
+        cache.clear()
+
+    def detail_url(self, post):
+        return '/blog/post/' + str(post.pk) + '/'
+
+    def test_anonymous_pages_served_from_cache(self):
+        self.client.get('/blog/')
+        self.client.get(self.detail_url(self.post))
+        # Only the conditional GET validators are read on a cache hit
+        with self.assertNumQueries(2):
+            self.assertContains(self.client.get('/blog/'), 'Cached Post')
+            self.assertContains(self.client.get(self.detail_url(self.post)), 'Cached Post')
+
+    def test_authenticated_pages_not_cached(self):
+        self.client.login(username='temporary', password='temporary')
+        self.client.get('/blog/')
+        response = self.client.get('/blog/')
+        self.assertTemplateUsed(response, 'post_list.html')
+        self.client.logout()
+
+    def test_post_edit_invalidates_only_that_post(self):
+        self.client.get('/blog/')
+        self.client.get(self.detail_url(self.post))
+        self.client.get(self.detail_url(self.other))
+        self.post.title = "Edited Post"
+        self.post.save()
+        self.assertContains(self.client.get('/blog/'), 'Edited Post')
+        self.assertContains(self.client.get(self.detail_url(self.post)), 'Edited Post')
+        with self.assertNumQueries(1):
+            self.client.get(self.detail_url(self.other))
+
+    def test_post_delete_invalidates_list(self):
+        self.client.get('/blog/')
+        self.other.delete()
+        self.assertNotContains(self.client.get('/blog/'), 'Other Post')
+
+    def test_pending_comment_keeps_cache_and_approval_clears_it(self):
+        self.client.get(self.detail_url(self.post))
+        comment = Comment.objects.create(post=self.post, author="Commenter", text="Hello")
+        with self.assertNumQueries(1):
+            self.assertNotContains(self.client.get(self.detail_url(self.post)), 'Commenter')
+        comment.approve()
+        self.assertContains(self.client.get(self.detail_url(self.post)), 'Commenter')
+        self.assertContains(self.client.get('/blog/'), 'Comments: 1</a>')
+
+
+class ConditionalGetTest(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user('temporary', 'temporary@gmail.com', 'temporary')
+        self.post = Post.objects.create(author=self.user, title="Conditional Post", subtitle="Subtitle", text="Text")
+        self.post.publish()
+        self.url = '/blog/post/' + str(self.post.pk) + '/'
+
+    def tearDown(self):
+        self.user.delete()
+
+    def test_post_detail_not_modified(self):
+        response = self.client.get(self.url)
+        self.assertTrue(response.has_header('ETag'))
+        self.assertTrue(response.has_header('Last-Modified'))
+        response2 = self.client.get(self.url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response2.status_code, 304)
+        self.assertTemplateNotUsed(response2, 'post_detail.html')
+        response3 = self.client.get(self.url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+        self.assertEqual(response3.status_code, 304)
+
+    def test_post_edit_changes_etag(self):
+        etag = self.client.get(self.url)['ETag']
+        self.post.title = "Edited Conditional Post"
+        self.post.save()
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, "Edited Conditional Post")
+
+    def test_approved_comment_changes_etag(self):
+        etag = self.client.get(self.url)['ETag']
+        comment = Comment.objects.create(post=self.post, author="Commenter", text="Text")
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        comment.approve()
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_post_list_not_modified_until_post_removed(self):
+        etag = self.client.get('/blog/')['ETag']
+        self.assertEqual(self.client.get('/blog/', HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        other = Post.objects.create(author=self.user, title="Other", subtitle="Subtitle", text="Text")
+        etag = self.client.get('/blog/')['ETag']
+        other.delete()
+        self.assertEqual(self.client.get('/blog/', HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_authenticated_gets_no_validators(self):
+        self.client.login(username='temporary', password='temporary')
+        response = self.client.get(self.url)
+        self.assertFalse(response.has_header('ETag'))
+        self.client.logout()
+
+
+@override_settings(BLOG_PAGE_SIZE=2)
+class SearchTest(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user('temporary', 'temporary@gmail.com', 'temporary')
+
+    def tearDown(self):
+        self.user.delete()
+
+    def create_post(self, title, text, publish=True):
+        post = Post.objects.create(author=self.user, title=title, subtitle="Subtitle", text=text)
+        if publish:
+            post.publish()
+        return post
+
+    def titles(self, response):
+        return [post.title for post in response.context['posts']]
+
+    def test_url_resolves_to_search_view(self):
+        self.assertEqual(resolve('/blog/search/').func, post_search)
+
+    def test_title_match_ranks_above_text_match(self):
+        self.create_post("Gardening notes", "Mostly about tomatoes")
+        self.create_post("Tomatoes", "A whole post about growing tomatoes")
+        self.create_post("Cooking", "Nothing relevant")
+        response = self.client.get('/blog/search/?q=tomatoes')
+        self.assertEqual(self.titles(response), ["Tomatoes", "Gardening notes"])
+
+    def test_snippet_is_highlighted_and_escaped(self):
+        self.create_post("Snippet", "Some <script>bad</script> text about kayaks")
+        response = self.client.get('/blog/search/?q=kayaks')
+        self.assertContains(response, '<mark>kayaks</mark>')
+        self.assertNotContains(response, '<script>bad')
+
+    def test_drafts_are_not_found(self):
+        self.create_post("Secret draft", "unpublished words", publish=False)
+        response = self.client.get('/blog/search/?q=unpublished')
+        self.assertEqual(self.titles(response), [])
+        self.assertContains(response, 'No posts match')
+
+    def test_edits_and_deletes_update_index(self):
+        post = self.create_post("Kept", "original wording")
+        post.text = "changed wording"
+        post.save()
+        self.assertEqual(self.titles(self.client.get('/blog/search/?q=original')), [])
+        self.assertEqual(self.titles(self.client.get('/blog/search/?q=changed')), ["Kept"])
+        post.delete()
+        self.assertEqual(self.titles(self.client.get('/blog/search/?q=changed')), [])
+
+    def test_cursor_pagination(self):
+        for i in range(5):
+            self.create_post("Result " + str(i), "shared term")
+        response = self.client.get('/blog/search/?q=shared')
+        seen = self.titles(response)
+        self.assertIn('rel="next"', response['Link'])
+        while response.context['page'].has_next():
+            response = self.client.get(response.context['page'].next_url)
+            seen += self.titles(response)
+        self.assertEqual(sorted(seen), ["Result " + str(i) for i in range(5)])
+
+    def test_awkward_query_does_not_error(self):
+        response = self.client.get('/blog/search/?q=' + '"AND (*')
+        self.assertEqual(response.status_code, 200)
+
+    def test_rebuild_search_index_command(self):
+        self.create_post("Rebuilt", "searchable words")
+        with connection.cursor() as cursor:
+            cursor.execute('DELETE FROM blog_post_fts')
+        out = StringIO()
+        call_command('rebuild_search_index', stdout=out)
+        self.assertIn('Indexed 1 posts', out.getvalue())
+        self.assertEqual(self.titles(self.client.get('/blog/search/?q=searchable')), ["Rebuilt"])
+
+
+class FeedTest(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user('temporary', 'temporary@gmail.com', 'temporary')
+        self.post = Post.objects.create(author=self.user, title="Feed Post", subtitle="Subtitle", text="Some *feed* text")
+        self.post.publish()
+        Post.objects.create(author=self.user, title="Feed Draft", subtitle="Subtitle", text="Text")
+
+    def tearDown(self):
+        self.user.delete()
+
+    def test_rss_feed_lists_published_posts(self):
+        response = self.client.get('/blog/feed/rss/')
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, '<title>Feed Post</title>')
+        self.assertContains(response, '&lt;em&gt;feed&lt;/em&gt;')
+        self.assertNotContains(response, 'Feed Draft')
+
+    def test_atom_feed(self):
+        response = self.client.get('/blog/feed/atom/')
+        self.assertContains(response, 'xmlns="http://www.w3.org/2005/Atom"')
+        self.assertContains(response, '/blog/post/' + str(self.post.pk) + '/')
+
+    @override_settings(FEED_ITEM_COUNT=2)
+    def test_item_count_is_bounded(self):
+        for i in range(3):
+            Post.objects.create(author=self.user, title="Extra " + str(i), subtitle="Subtitle", text="Text").publish()
+        response = self.client.get('/blog/feed/rss/')
+        self.assertEqual(response.content.decode('utf8').count('<item>'), 2)
+
+    def test_feed_queries_do_not_grow_with_items(self):
+        with CaptureQueriesContext(connection) as one:
+            self.client.get('/blog/feed/rss/')
+        for i in range(3):
+            Post.objects.create(author=self.user, title="Extra " + str(i), subtitle="Subtitle", text="").publish()
+        with CaptureQueriesContext(connection) as four:
+            response = self.client.get('/blog/feed/rss/')
+        self.assertEqual(response.content.decode('utf8').count('<item>'), 4)
+        self.assertEqual(len(four), len(one))
+
+    def test_unrendered_posts_are_rendered_for_the_feed(self):
+        self.client.get('/blog/feed/rss/')
+        # As left by migrations before render_posts has run
+        Post.objects.filter(pk=self.post.pk).update(rendered_html='')
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/blog/feed/rss/')
+        self.assertContains(response, '&lt;em&gt;feed&lt;/em&gt;')
+        Post.objects.filter(pk=self.post.pk).update(rendered_html='<p>Stored</p>')
+        with CaptureQueriesContext(connection) as stored:
+            self.assertContains(self.client.get('/blog/feed/rss/'), 'Stored')
+        self.assertEqual(len(queries), len(stored))
+
+    def test_feed_not_modified_until_publish(self):
+        etag = self.client.get('/blog/feed/rss/')['ETag']
+        self.assertEqual(self.client.get('/blog/feed/rss/', HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        Post.objects.create(author=self.user, title="Newer", subtitle="Subtitle", text="Text").publish()
+        response = self.client.get('/blog/feed/rss/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Newer')
+
+    @override_settings(PAGE_CACHE_TIMEOUT=60)
+    def test_feed_cached_until_edit(self):
+        cache.clear()
+        self.client.get('/blog/feed/rss/')
+        with self.assertNumQueries(1):
+            self.client.get('/blog/feed/rss/')
+        self.post.title = "Edited Feed Post"
+        self.post.save()
+        self.assertContains(self.client.get('/blog/feed/rss/'), 'Edited Feed Post')
+        cache.clear()
+
+
+class MonthlyArchiveTest(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user('temporary', 'temporary@gmail.com', 'temporary')
+
+    def tearDown(self):
+        self.user.delete()
+
+    def create_post(self, title, published_date):
+        return Post.objects.create(author=self.user, title=title, subtitle="Subtitle", text="Text", published_date=published_date)
+
+    def month(self, year, month):
+        return timezone.make_aware(datetime.datetime(year, month, 15))
+
+    def counts(self):
+        return {(archive.year, archive.month): archive.count for archive in MonthlyArchive.objects.all()}
+
+    def test_publishing_counts_the_month(self):
+        self.create_post("March", self.month(2020, 3))
+        draft = self.create_post("Draft", None)
+        self.assertEqual(self.counts(), {(2020, 3): 1})
+        draft.publish()
+        now = timezone.localtime()
+        self.assertEqual(self.counts(), {(2020, 3): 1, (now.year, now.month): 1})
+
+    def test_moving_published_date_moves_count(self):
+        post = self.create_post("Moved", self.month(2020, 3))
+        post = Post.objects.get(pk=post.pk)
+        post.published_date = self.month(2020, 5)
+        post.save()
+        self.assertEqual(self.counts(), {(2020, 3): 0, (2020, 5): 1})
+
+    def test_unrelated_saves_leave_counts_alone(self):
+        post = self.create_post("Edited", self.month(2020, 3))
+        post.text = "New text"
+        post.save(update_fields=['text'])
+        Post.objects.only('title').get(pk=post.pk).save()
+        self.assertEqual(self.counts(), {(2020, 3): 1})
+
+    def test_deleting_posts_decrements(self):
+        self.create_post("One", self.month(2020, 3))
+        self.create_post("Two", self.month(2020, 3))
+        self.client.login(username='temporary', password='temporary')
+        self.client.get('/blog/post/' + str(Post.objects.first().pk) + '/remove/')
+        self.assertEqual(self.counts(), {(2020, 3): 1})
+        Post.objects.all().delete()
+        self.assertEqual(self.counts(), {(2020, 3): 0})
+
+    def test_archive_page_lists_only_that_month(self):
+        self.create_post("March", self.month(2020, 3))
+        self.create_post("April", self.month(2020, 4))
+        response = self.client.get('/blog/2020/3/')
+        self.assertEqual([post.title for post in response.context['posts']], ["March"])
+        self.assertContains(response, 'Posts from March 2020')
+
+    def test_december_archive(self):
+        self.create_post("December", self.month(2019, 12))
+        self.create_post("January", self.month(2020, 1))
+        response = self.client.get('/blog/2019/12/')
+        self.assertEqual([post.title for post in response.context['posts']], ["December"])
+
+    def test_invalid_month_is_404(self):
+        self.assertEqual(self.client.get('/blog/2020/13/').status_code, 404)
+        # The month after December 9999 is out of range too
+        self.assertEqual(self.client.get('/blog/9999/12/').status_code, 404)
+        self.assertEqual(self.client.get('/blog/0/1/').status_code, 404)
+
+    def test_sidebar_links_months_with_posts(self):
+        self.create_post("March", self.month(2020, 3))
+        moved = self.create_post("Moved", self.month(2020, 4))
+        moved.published_date = self.month(2020, 3)
+        moved.save()
+        response = self.client.get('/blog/')
+        self.assertContains(response, '<a href="/blog/2020/3/">March 2020</a> (2)', html=False)
+        self.assertNotContains(response, '/blog/2020/4/')
+
+    def test_rebuild_archive_command(self):
+        self.create_post("March", self.month(2020, 3))
+        MonthlyArchive.objects.update(count=42)
+        out = StringIO()
+        call_command('rebuild_archive', stdout=out)
+        self.assertIn('Counted posts in 1 months', out.getvalue())
+        self.assertEqual(self.counts(), {(2020, 3): 1})
+
+
+@override_settings(BLOG_PAGE_SIZE=2)
+class TagTest(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user('temporary', 'temporary@gmail.com', 'temporary')
+        self.python = Tag.objects.create(name="Python")
+        self.django = Tag.objects.create(name="Django")
+
+    def tearDown(self):
+        self.user.delete()
+
+    def create_post(self, title, publish=True):
+        post = Post.objects.create(author=self.user, title=title, subtitle="Subtitle", text="Text")
+        if publish:
+            post.publish()
+        return post
+
+    def counts(self):
+        return {tag.name: tag.post_count for tag in Tag.objects.all()}
+
+    def test_counts_only_published_posts(self):
+        post = self.create_post("Published")
+        draft = self.create_post("Draft", publish=False)
+        post.tags.add(self.python, self.django)
+        draft.tags.add(self.python)
+        self.assertEqual(self.counts(), {"Python": 1, "Django": 1})
+        draft.publish()
+        self.assertEqual(self.counts(), {"Python": 2, "Django": 1})
+
+    def test_remove_clear_and_delete_update_counts(self):
+        first, second = self.create_post("First"), self.create_post("Second")
+        self.python.posts.add(first, second)
+        first.tags.add(self.django)
+        self.assertEqual(self.counts(), {"Python": 2, "Django": 1})
+        first.tags.remove(self.python)
+        self.assertEqual(self.counts(), {"Python": 1, "Django": 1})
+        first.tags.clear()
+        self.assertEqual(self.counts(), {"Python": 1, "Django": 0})
+        second.delete()
+        self.assertEqual(self.counts(), {"Python": 0, "Django": 0})
+
+    def test_form_creates_and_sets_tags(self):
+        self.client.login(username='temporary', password='temporary')
+        self.client.post('/blog/post/new/', {'title': "Tagged", 'subtitle': "Subtitle", 'text': "Text", 'tags': "python, New Tag, , NEW TAG"})
+        post = Post.objects.get(title="Tagged")
+        self.assertEqual(sorted(tag.name for tag in post.tags.all()), ["New Tag", "Python"])
+        response = self.client.get('/blog/post/' + str(post.pk) + '/edit/')
+        self.assertEqual(response.context['form'].initial['tags'], ', '.join(tag.name for tag in post.tags.all()))
+        self.client.post('/blog/post/' + str(post.pk) + '/edit/', {'title': "Tagged", 'subtitle': "Subtitle", 'text': "Text", 'tags': "Django"})
+        self.assertEqual([tag.name for tag in post.tags.all()], ["Django"])
+        self.client.logout()
+
+    def test_tag_page_pages_through_published_posts(self):
+        for i in range(3):
+            self.create_post("Tagged " + str(i)).tags.add(self.python)
+        self.create_post("Untagged")
+        self.create_post("Tagged draft", publish=False).tags.add(self.python)
+        response = self.client.get('/blog/tag/python/')
+        seen = [post.title for post in response.context['posts']]
+        while response.context['page'].has_next():
+            response = self.client.get(response.context['page'].next_url)
+            seen += [post.title for post in response.context['posts']]
+        self.assertEqual(seen, ["Tagged 2", "Tagged 1", "Tagged 0"])
+
+    def test_tag_page_follows_published_date_changes(self):
+        post = self.create_post("Moved")
+        post.tags.add(self.python)
+        post.published_date = timezone.now() + timedelta(days=1)
+        post.save()
+        self.assertEqual(list(self.client.get('/blog/tag/python/').context['posts']), [])
+
+    def test_unknown_tag_is_404(self):
+        self.assertEqual(self.client.get('/blog/tag/nothing/').status_code, 404)
+
+    def test_cards_and_cloud_show_tags(self):
+        self.create_post("Card").tags.add(self.python)
+        response = self.client.get('/blog/')
+        self.assertContains(response, 'href="/blog/tag/python/">Python</a>', count=2)
+        self.assertNotContains(response, '/blog/tag/django/')
+
+    def test_tagging_changes_post_etag(self):
+        post = self.create_post("Etag")
+        etag = self.client.get('/blog/post/' + str(post.pk) + '/')['ETag']
+        post.tags.add(self.python)
+        self.assertNotEqual(self.client.get('/blog/post/' + str(post.pk) + '/')['ETag'], etag)
+
+    def test_rebuild_tag_counts_command(self):
+        self.create_post("Counted").tags.add(self.python)
+        Tag.objects.update(post_count=42)
+        out = StringIO()
+        call_command('rebuild_tag_counts', stdout=out)
+        self.assertIn('Recounted 2 tags', out.getvalue())
+        self.assertEqual(self.counts(), {"Python": 1, "Django": 0})
+
+
+@override_settings(RELATED_POSTS_COUNT=2)
+class RelatedPostsTest(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user('temporary', 'temporary@gmail.com', 'temporary')
+        self.tomatoes = self.create_post("Growing tomatoes", "Tomatoes need sun, water and a trellis in the garden")
+        self.peppers = self.create_post("Growing peppers", "Peppers need sun and water in the garden, like tomatoes")
+        self.bread = self.create_post("Baking bread", "Flour, yeast and water make dough for bread")
+
+    def tearDown(self):
+        self.user.delete()
+
+    def create_post(self, title, text, publish=True):
+        post = Post.objects.create(author=self.user, title=title, subtitle="Subtitle", text=text)
+        if publish:
+            post.publish()
+        return post
+
+    def build(self, *args):
+        out = StringIO()
+        call_command('build_related_posts', *args, stdout=out)
+        return out.getvalue()
+
+    def titles(self, post):
+        return [other.title for other in post.related_posts()]
+
+    def test_tokenize_skips_stop_words_and_numbers(self):
+        self.assertEqual(related.tokenize("The 3 tomatoes, and THE Tomatoes2 of it"), ["tomatoes", "tomatoes"])
+
+    def test_most_similar_posts_first(self):
+        self.assertIn('Updated related posts of 3 posts', self.build())
+        self.assertEqual(self.titles(self.tomatoes)[0], "Growing peppers")
+        self.assertEqual(self.titles(self.peppers)[0], "Growing tomatoes")
+
+    def test_post_detail_shows_related_posts(self):
+        self.build()
+        response = self.client.get('/blog/post/' + str(self.tomatoes.pk) + '/')
+        self.assertContains(response, 'Related posts')
+        self.assertContains(response, '<a href="/blog/post/' + str(self.peppers.pk) + '/">Growing peppers</a>')
+
+    def test_unpublished_posts_are_hidden(self):
+        self.build()
+        self.peppers.published_date = None
+        self.peppers.save()
+        self.assertNotIn("Growing peppers", self.titles(self.tomatoes))
+
+    def test_incremental_build_only_touches_changed_posts(self):
+        self.build()
+        self.assertIn('Updated related posts of 0 posts', self.build())
+        self.create_post("Baking rye bread", "Rye flour and yeast make a dense bread dough")
+        self.create_post("Draft", "Yeast and flour", publish=False)
+        # The new post, and the bread post it now ranks first for
+        self.assertIn('Updated related posts of 2 posts', self.build())
+        self.assertEqual(self.titles(self.bread)[0], "Baking rye bread")
+
+    def test_edited_post_leaves_other_lists(self):
+        self.build()
+        self.peppers.title = "Knitting"
+        self.peppers.text = "Wool and needles turn into scarves"
+        self.peppers.save()
+        self.build()
+        self.assertNotIn("Knitting", self.titles(self.tomatoes))
+        self.assertEqual(self.titles(Post.objects.get(pk=self.peppers.pk)), [])
+
+    def test_renaming_a_related_post_changes_listing_etag(self):
+        self.build()
+        url = '/blog/post/' + str(self.tomatoes.pk) + '/'
+        etag = self.client.get(url)['ETag']
+        self.peppers.title = "Growing chillies"
+        self.peppers.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, "Growing chillies")
+
+    @override_settings(RELATED_POSTS_COUNT=1)
+    def test_deleting_a_related_post_refills_listing_posts(self):
+        self.build()
+        self.assertEqual(self.titles(self.tomatoes), ["Growing peppers"])
+        url = '/blog/post/' + str(self.tomatoes.pk) + '/'
+        etag = self.client.get(url)['ETag']
+        self.peppers.delete()
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+        self.build()
+        self.assertEqual(self.titles(self.tomatoes), ["Baking bread"])
+
+    def test_build_changes_post_etag(self):
+        etag = self.client.get('/blog/post/' + str(self.tomatoes.pk) + '/')['ETag']
+        self.build()
+        self.assertNotEqual(self.client.get('/blog/post/' + str(self.tomatoes.pk) + '/')['ETag'], etag)
+
+
+class ScheduledPublishingTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('temporary', 'temporary@gmail.com', 'temporary')
+        self.post = Post.objects.create(author=self.user, title="Scheduled", subtitle="Subtitle", text="Text")
+        self.when = timezone.now() + timedelta(hours=1)
+        self.post.publish(self.when)
+
+    def tearDown(self):
+        self.user.delete()
+        cache.clear()
+
+    def go_live(self):
+        # Jump the clock past the publish time
+        return mock.patch('django.utils.timezone.now', return_value=self.when + timedelta(seconds=1))
+
+    def publish_scheduled(self, *args):
+        out = StringIO()
+        call_command('publish_scheduled', *args, stdout=out)
+        return out.getvalue()
+
+    def test_hidden_until_publish_time(self):
+        self.assertNotContains(self.client.get('/blog/'), 'Scheduled')
+        with self.go_live():
+            self.assertContains(self.client.get('/blog/'), 'Scheduled')
+
+    def test_form_schedules_post(self):
+        self.client.login(username='temporary', password='temporary')
+        when = (timezone.localtime() + timedelta(days=2)).strftime('%Y-%m-%d %H:%M')
+        self.client.post('/blog/post/new/', {'title': "Later", 'subtitle': "Subtitle", 'text': "Text", 'published_date': when})
+        post = Post.objects.get(title="Later")
+        self.assertEqual(timezone.localtime(post.published_date).strftime('%Y-%m-%d %H:%M'), when)
+        self.assertContains(self.client.get('/blog/drafts/'), 'Later</a> at')
+        self.client.logout()
+
+    def test_next_publish_time(self):
+        self.assertEqual(schedule.next_publish_time(), self.when)
+        self.post.publish()
+        self.assertIsNone(schedule.next_publish_time())
+
+    @override_settings(PAGE_CACHE_TIMEOUT=3600)
+    def test_page_cache_expires_at_publish_time(self):
+        self.assertAlmostEqual(pagecache.page_timeout(['posts']), (self.when - timezone.now()).total_seconds(), delta=5)
+        self.assertAlmostEqual(pagecache.page_timeout(['sitemap-posts:0']), (self.when - timezone.now()).total_seconds(), delta=5)
+        self.assertEqual(pagecache.page_timeout(['post:1']), 3600)
+        self.post.publish(timezone.now() + timedelta(days=1))
+        self.assertEqual(pagecache.page_timeout(['posts']), 3600)
+
+    def test_etag_changes_when_post_goes_live(self):
+        etag = self.client.get('/blog/')['ETag']
+        self.assertEqual(self.client.get('/blog/', HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        with self.go_live():
+            self.assertEqual(self.client.get('/blog/', HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_publish_scheduled_stamps_due_posts_once(self):
+        self.assertIn('Published 0 scheduled posts', self.publish_scheduled())
+        with self.go_live():
+            etag = self.client.get('/blog/post/' + str(self.post.pk) + '/')['ETag']
+            out = self.publish_scheduled()
+            self.assertIn('Published 1 scheduled posts', out)
+            self.assertIn('Warmed 5 pages', out)
+            self.assertNotEqual(self.client.get('/blog/post/' + str(self.post.pk) + '/')['ETag'], etag)
+            self.assertIn('Published 0 scheduled posts', self.publish_scheduled())
+
+    def archive_counts(self):
+        return sum(MonthlyArchive.objects.values_list('count', flat=True))
+
+    def test_counted_in_archive_and_tags_only_once_live(self):
+        self.post.tags.add(Tag.objects.create(name="Soon"))
+        self.assertEqual((self.archive_counts(), Tag.objects.get().post_count), (0, 0))
+        self.assertNotContains(self.client.get('/blog/'), 'Soon')
+        with self.go_live():
+            schedule.publish_due()
+        self.assertEqual((self.archive_counts(), Tag.objects.get().post_count), (1, 1))
+        self.assertTrue(Post.objects.get(pk=self.post.pk).live)
+
+    def test_rescheduling_and_deleting_scheduled_post_leaves_counts(self):
+        post = Post.objects.get(pk=self.post.pk)
+        post.publish(self.when + timedelta(days=40))
+        post.delete()
+        self.assertEqual(self.archive_counts(), 0)
+
+    def test_publishing_now_counts_at_once(self):
+        self.post.publish()
+        self.assertEqual(self.archive_counts(), 1)
+        self.assertEqual(schedule.publish_due(), [])
+        self.assertEqual(self.archive_counts(), 1)
+
+
+@override_settings(BLOG_PAGE_SIZE=2, COMMENTS_PAGE_SIZE=2)
+class ApiTest(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user('temporary', 'temporary@gmail.com', 'temporary')
+        self.posts = []
+        for i in range(3):
+            post = Post.objects.create(author=self.user, title="Api " + str(i), subtitle="Subtitle", text="Some *text*")
+            post.publish()
+            self.posts.append(post)
+        self.draft = Post.objects.create(author=self.user, title="Api draft", subtitle="Subtitle", text="Text")
+
+    def tearDown(self):
+        self.user.delete()
+
+    def test_list_pages_through_published_posts(self):
+        response = self.client.get('/blog/api/posts/')
+        self.assertEqual(response['Content-Type'], 'application/json')
+        data = response.json()
+        titles = [post['title'] for post in data['results']]
+        self.assertIn('rel="next"', response['Link'])
+        while data['next']:
+            data = self.client.get(data['next']).json()
+            titles += [post['title'] for post in data['results']]
+        self.assertEqual(titles, ["Api 2", "Api 1", "Api 0"])
+        self.assertEqual(set(data['results'][0]), set(api.POST_LIST_FIELDS))
+
+    def test_sparse_fields_select_only_those_columns(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/blog/api/posts/?fields=title')
+        self.assertEqual(response.json()['results'][0], {'title': "Api 2"})
+        sql = [query['sql'] for query in queries.captured_queries if 'FROM "blog_post"' in query['sql']][-1]
+        self.assertNotIn('"text"', sql)
+        self.assertNotIn('"subtitle"', sql)
+
+    def test_unknown_field_is_400(self):
+        response = self.client.get('/blog/api/posts/?fields=title,password')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('password', response.json()['error'])
+
+    def test_detail(self):
+        post = self.posts[0]
+        data = self.client.get('/blog/api/posts/' + str(post.pk) + '/?fields=id,rendered_html').json()
+        self.assertEqual(data, {'id': post.pk, 'rendered_html': '<p>Some <em>text</em></p>'})
+        response = self.client.get('/blog/api/posts/' + str(self.draft.pk) + '/')
+        self.assertEqual(response.status_code, 404)
+        self.assertIn('error', response.json())
+
+    def test_comments_are_approved_only_and_paginated(self):
+        post = self.posts[0]
+        for i in range(3):
+            Comment.objects.create(post=post, author="Reader " + str(i), text="Text", approved_comment=True)
+        Comment.objects.create(post=post, author="Pending", text="Text")
+        data = self.client.get('/blog/api/posts/' + str(post.pk) + '/comments/?fields=author').json()
+        authors = [comment['author'] for comment in data['results']]
+        data = self.client.get(data['next']).json()
+        authors += [comment['author'] for comment in data['results']]
+        self.assertEqual(authors, ["Reader 0", "Reader 1", "Reader 2"])
+        self.assertIsNone(data['next'])
+
+    def test_comments_come_as_threads(self):
+        post = self.posts[0]
+        first = Comment.objects.create(post=post, author="First", text="Text", approved_comment=True)
+        Comment.objects.create(post=post, author="Second", text="Text", approved_comment=True)
+        reply = Comment.objects.create(post=post, parent=first, author="Reply", text="Text", approved_comment=True)
+        Comment.objects.create(post=post, author="Third", text="Text", approved_comment=True)
+        data = self.client.get('/blog/api/posts/' + str(post.pk) + '/comments/?fields=id,author,parent_id,depth').json()
+        self.assertEqual(data['results'], [
+            {'id': first.pk, 'author': "First", 'parent_id': None, 'depth': 0},
+            {'id': reply.pk, 'author': "Reply", 'parent_id': first.pk, 'depth': 1},
+            {'id': first.pk + 1, 'author': "Second", 'parent_id': None, 'depth': 0},
+        ])
+        data = self.client.get(data['next']).json()
+        self.assertEqual([comment['author'] for comment in data['results']], ["Third"])
+
+    def test_etag_and_gzip(self):
+        response = self.client.get('/blog/api/posts/', HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertIn('Accept-Encoding', response['Vary'])
+        etag = response['ETag']
+        response = self.client.get('/blog/api/posts/', HTTP_ACCEPT_ENCODING='gzip', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.posts[0].title = "Edited"
+        self.posts[0].save()
+        response = self.client.get('/blog/api/posts/', HTTP_ACCEPT_ENCODING='gzip', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+
+class BulkModerationTest(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user('temporary', 'temporary@gmail.com', 'temporary')
+        self.first = Post.objects.create(author=self.user, title="First", subtitle="Subtitle", text="Text")
+        self.second = Post.objects.create(author=self.user, title="Second", subtitle="Subtitle", text="Text")
+        self.first.publish()
+        self.second.publish()
+        self.client.login(username='temporary', password='temporary')
+
+    def tearDown(self):
+        self.client.logout()
+        self.user.delete()
+
+    def comments(self, post, count, approved=False):
+        return [Comment.objects.create(post=post, author="Author", text="Text", approved_comment=approved).pk for i in range(count)]
+
+    def counts(self):
+        return [post.approved_comment_count for post in Post.objects.order_by('pk')]
+
+    def moderate(self, action, pks, **extra):
+        return self.client.post('/blog/comments/moderate/', dict({'action': action, 'comment': pks}, **extra))
+
+    def test_approve_many_adjusts_each_post_once(self):
+        pks = self.comments(self.first, 3) + self.comments(self.second, 2) + self.comments(self.first, 1, approved=True)
+        response = self.moderate('approve', pks)
+        self.assertEqual(response.json(), {'approved': 5})
+        self.assertEqual(self.counts(), [4, 2])
+        self.assertFalse(Comment.objects.filter(approved_comment=False).exists())
+
+    def test_remove_many_decrements_only_approved(self):
+        approved = self.comments(self.first, 2, approved=True)
+        pending = self.comments(self.first, 2) + self.comments(self.second, 1)
+        response = self.moderate('remove', approved[:1] + pending)
+        self.assertEqual(response.json(), {'removed': 4})
+        self.assertEqual(self.counts(), [1, 0])
+        self.assertEqual(list(Comment.objects.values_list('pk', flat=True)), approved[1:])
+
+    def test_query_count_does_not_grow_with_comments(self):
+        few = self.comments(self.first, 2) + self.comments(self.second, 2)
+        many = self.comments(self.first, 20) + self.comments(self.second, 20)
+        # Warm up the session and the LastChange rows
+        self.moderate('approve', self.comments(self.first, 1) + self.comments(self.second, 1))
+        with CaptureQueriesContext(connection) as first_run:
+            self.moderate('approve', few)
+        with CaptureQueriesContext(connection) as second_run:
+            self.moderate('approve', many)
+        self.assertEqual(len(first_run), len(second_run))
+
+    def test_approval_changes_post_etag(self):
+        pks = self.comments(self.first, 2)
+        self.client.logout()
+        etag = self.client.get('/blog/post/' + str(self.first.pk) + '/')['ETag']
+        self.client.login(username='temporary', password='temporary')
+        self.moderate('approve', pks)
+        self.client.logout()
+        self.assertNotEqual(self.client.get('/blog/post/' + str(self.first.pk) + '/')['ETag'], etag)
+
+    def test_redirects_to_safe_next(self):
+        pks = self.comments(self.first, 1)
+        response = self.moderate('approve', pks, next='/blog/post/' + str(self.first.pk) + '/')
+        self.assertRedirects(response, '/blog/post/' + str(self.first.pk) + '/')
+        response = self.moderate('remove', pks, next='https://example.com/')
+        self.assertEqual(response.json(), {'removed': 1})
+
+    def test_rejects_bad_requests(self):
+        self.assertEqual(self.moderate('publish', []).status_code, 400)
+        self.assertEqual(self.moderate('approve', ['\u00b2']).status_code, 400)
+        self.assertEqual(self.moderate('remove', ['9' * 30]).status_code, 400)
+        self.assertEqual(self.client.get('/blog/comments/moderate/').status_code, 405)
+        self.client.logout()
+        self.assertEqual(self.moderate('approve', self.comments(self.first, 1)).status_code, 302)
+        self.assertEqual(self.counts(), [0, 0])
+
+    def test_post_detail_has_bulk_form(self):
+        self.comments(self.first, 1)
+        response = self.client.get('/blog/post/' + str(self.first.pk) + '/')
+        self.assertContains(response, 'form="moderate-comments"')
+        self.assertContains(response, 'value="approve"')
+
+
+@override_settings(COMMENT_QUEUE_INTERVAL=60, COMMENT_QUEUE_BATCH=3)
+class CommentQueueTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('temporary', 'temporary@gmail.com', 'temporary')
+        self.post = Post.objects.create(author=self.user, title="Queued", subtitle="Subtitle", text="Text")
+        self.queue = CommentQueue(background=False)
+
+    def tearDown(self):
+        self.user.delete()
+        cache.clear()
+
+    def test_comments_wait_for_flush(self):
+        for i in range(5):
+            self.assertTrue(self.queue.submit(self.post.pk, "Author", "Comment " + str(i)))
+        self.assertEqual(Comment.objects.count(), 0)
+        self.assertEqual(self.queue.stats()['depth'], 5)
+        # One query for the posts, then one INSERT per batch of 3 and one
+        # UPDATE setting their paths inside a transaction (a savepoint here,
+        # as tests already run in one)
+        with self.assertNumQueries(6):
+            self.assertEqual(self.queue.flush(), 5)
+        self.assertEqual(Comment.objects.filter(post=self.post, approved_comment=False).count(), 5)
+        stats = self.queue.stats()
+        self.assertEqual((stats['depth'], stats['flushed'], stats['last_flush_size']), (0, 5, 5))
+        self.assertIsNotNone(stats['last_flush_seconds'])
+
+    def test_double_submit_is_dropped(self):
+        self.assertTrue(self.queue.submit(self.post.pk, "Author", "Same  text"))
+        self.assertFalse(self.queue.submit(self.post.pk, " Author", "Same text "))
+        self.assertTrue(self.queue.submit(self.post.pk, "Author", "Other text"))
+        self.queue.flush()
+        self.assertEqual(Comment.objects.count(), 2)
+        self.assertEqual(self.queue.stats()['duplicates'], 1)
+
+    def test_comments_on_deleted_posts_are_dropped(self):
+        other = Post.objects.create(author=self.user, title="Deleted", subtitle="Subtitle", text="Text")
+        self.queue.submit(self.post.pk, "Author", "Kept")
+        self.queue.submit(other.pk, "Author", "Dropped")
+        other.delete()
+        self.assertEqual(self.queue.flush(), 1)
+        self.assertEqual(list(Comment.objects.values_list('text', flat=True)), ["Kept"])
+
+    def test_flush_due_waits_for_batch_or_interval(self):
+        self.assertEqual(self.queue.flush_due(), 0)
+        self.queue.submit(self.post.pk, "Author", "First")
+        self.queue.submit(self.post.pk, "Author", "Second")
+        self.assertEqual(self.queue.flush_due(), 0)
+        self.assertEqual(self.queue.flush_due(now=time.monotonic() + 60), 2)
+        for i in range(3):
+            self.queue.submit(self.post.pk, "Author", "Comment " + str(i))
+        self.assertEqual(self.queue.flush_due(), 3)
+        self.assertEqual(Comment.objects.count(), 5)
+
+    def test_view_writes_due_comments_after_the_response(self):
+        # As on a server that never runs the writer thread
+        url = '/blog/post/' + str(self.post.pk) + '/comment/'
+        with mock.patch('blog.views.comment_queue', self.queue), mock.patch('blog.ingest.comment_queue', self.queue):
+            for i in range(2):
+                self.client.post(url, {'author': "Reader", 'text': "Comment " + str(i)})
+            self.assertEqual(Comment.objects.count(), 0)
+            self.client.post(url, {'author': "Reader", 'text': "Comment 2"})
+        self.assertEqual(Comment.objects.count(), 3)
+        self.assertEqual(self.queue.depth(), 0)
+
+    @override_settings(COMMENT_QUEUE_INTERVAL=0)
+    def test_view_writes_at_once_without_interval_and_skips_repeats(self):
+        data = {'author': "Reader", 'text': "Hello"}
+        self.client.post('/blog/post/' + str(self.post.pk) + '/comment/', data)
+        response = self.client.post('/blog/post/' + str(self.post.pk) + '/comment/', data)
+        self.assertRedirects(response, '/blog/post/' + str(self.post.pk) + '/')
+        self.assertEqual(Comment.objects.filter(post=self.post).count(), 1)
+
+    def test_stats_endpoint_needs_login(self):
+        self.assertEqual(self.client.get('/blog/comments/queue/').status_code, 302)
+        self.client.login(username='temporary', password='temporary')
+        self.assertIn('depth', self.client.get('/blog/comments/queue/').json())
+        self.client.logout()
+
+@override_settings(COMMENT_QUEUE_INTERVAL=60, COMMENT_QUEUE_BATCH=3)
+class CommentQueueThreadTest(TransactionTestCase):
+    # The writer thread needs committed rows to see, hence no TestCase
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('temporary', 'temporary@gmail.com', 'temporary')
+        self.post = Post.objects.create(author=self.user, title="Threaded", subtitle="Subtitle", text="Text")
+        self.queue = CommentQueue()
+
+    def tearDown(self):
+        self.queue.stop()
+        cache.clear()
+
+    def wait_for(self, condition):
+        deadline = time.monotonic() + 10
+        while not condition() and time.monotonic() < deadline:
+            time.sleep(0.01)
+        return condition()
+
+    def test_full_batch_wakes_the_writer(self):
+        self.queue.submit(self.post.pk, "Author", "First")
+        self.assertTrue(self.queue._thread.is_alive())
+        self.assertEqual(self.queue.depth(), 1)
+        # Under a full batch the writer sleeps out the interval
+        time.sleep(0.1)
+        self.assertEqual(Comment.objects.count(), 0)
+        for i in range(settings.COMMENT_QUEUE_BATCH - 1):
+            self.queue.submit(self.post.pk, "Author", "Comment " + str(i))
+        self.assertTrue(self.wait_for(lambda: self.queue.flushed == settings.COMMENT_QUEUE_BATCH))
+        self.assertEqual(self.queue.depth(), 0)
+        self.assertEqual(Comment.objects.filter(post=self.post).exclude(path='').count(), settings.COMMENT_QUEUE_BATCH)
+
+    def test_stop_ends_the_writer(self):
+        self.queue.submit(self.post.pk, "Author", "Left queued")
+        thread = self.queue._thread
+        self.queue.stop()
+        self.assertFalse(thread.is_alive())
+        self.assertEqual(self.queue.flush(), 1)
+
+
+@override_settings(COMMENT_MAX_DEPTH=2)
+class ThreadedCommentTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('temporary', 'temporary@gmail.com', 'temporary')
+        self.post = Post.objects.create(author=self.user, title="Threads", subtitle="Subtitle", text="Text")
+        self.post.publish()
+
+    def tearDown(self):
+        self.user.delete()
+        cache.clear()
+
+    def comment(self, text, parent=None, approved=True):
+        return Comment.objects.create(post=self.post, parent=parent, author="Author", text=text, approved_comment=approved)
+
+    def reload(self, *comments):
+        return [Comment.objects.get(pk=comment.pk) for comment in comments]
+
+    def approved_count(self):
+        return Post.objects.get(pk=self.post.pk).approved_comment_count
+
+    def thread(self, cursor=None, per_page=2, comments=None):
+        request = RequestFactory().get('/', {'cursor': cursor} if cursor else {})
+        comments = comments if comments is not None else self.post.comments.filter(approved_comment=True)
+        return paginate_threads(request, comments, per_page)
+
+    def test_paths_depths_and_reply_counts_are_stored(self):
+        top = self.comment("Top")
+        reply = self.comment("Reply", top)
+        pending = self.comment("Pending", reply, approved=False)
+        top, reply, pending = self.reload(top, reply, pending)
+        self.assertEqual(reply.path, top.path + Comment.path_segment(reply.pk))
+        self.assertEqual([top.depth, reply.depth, pending.depth], [0, 1, 2])
+        self.assertEqual([top.reply_count, reply.reply_count], [1, 0])
+        pending.approve()
+        self.assertEqual([comment.reply_count for comment in self.reload(top, reply)], [2, 1])
+        self.assertEqual(self.approved_count(), 3)
+
+    def test_page_of_threads_is_one_ordered_query(self):
+        first = self.comment("First")
+        self.comment("Second")
+        self.comment("Nested", self.comment("First reply", first))
+        self.comment("Third reply", self.comment("Third"))
+        with self.assertNumQueries(1):
+            page = self.thread()
+        self.assertEqual([comment.text for comment in page], ["First", "First reply", "Nested", "Second"])
+        self.assertTrue(page.has_next())
+        page = self.thread(page.next_cursor)
+        self.assertEqual([comment.text for comment in page], ["Third", "Third reply"])
+        self.assertFalse(page.has_next())
+
+    def test_invalid_thread_cursor_is_404(self):
+        response = self.client.get(reverse('post_comments', kwargs={'pk': self.post.pk}) + '?cursor=abc')
+        self.assertEqual(response.status_code, 404)
+
+    def test_reply_through_view(self):
+        top = self.comment("Top")
+        url = reverse('add_comment_to_post', kwargs={'pk': self.post.pk}) + '?reply_to=' + str(top.pk)
+        self.assertContains(self.client.get(url), 'Replying to Author')
+        self.client.post(url, {'author': "Reader", 'text': "A reply"})
+        reply = Comment.objects.get(text="A reply")
+        self.assertEqual((reply.parent_id, reply.depth, reply.path), (top.pk, 1, top.path + Comment.path_segment(reply.pk)))
+        self.assertContains(self.client.get('/blog/post/' + str(self.post.pk) + '/'), '?reply_to=' + str(top.pk))
+
+    def test_replies_stop_at_max_depth(self):
+        top = self.comment("Top")
+        reply = self.comment("Reply", top)
+        deepest = self.comment("Deepest", reply)
+        self.client.post(reverse('add_comment_to_post', kwargs={'pk': self.post.pk}) + '?reply_to=' + str(deepest.pk), {'author': "Reader", 'text': "Too deep"})
+        too_deep = Comment.objects.get(text="Too deep")
+        self.assertEqual((too_deep.parent_id, too_deep.depth), (reply.pk, 2))
+
+    def test_only_approved_comments_take_replies(self):
+        pending = self.comment("Pending", approved=False)
+        url = reverse('add_comment_to_post', kwargs={'pk': self.post.pk}) + '?reply_to='
+        self.assertEqual(self.client.get(url + str(pending.pk)).status_code, 404)
+        self.assertEqual(self.client.get(url + 'x').status_code, 404)
+        self.assertEqual(self.client.get(url + '\u00b2').status_code, 404)
+        self.assertEqual(self.client.get(url + '9' * 30).status_code, 404)
+
+    def test_delete_takes_replies_and_their_counts(self):
+        top = self.comment("Top")
+        reply = self.comment("Reply", top)
+        self.comment("Nested", reply)
+        self.comment("Pending", reply, approved=False)
+        self.comment("Other")
+        self.reload(reply)[0].delete()
+        self.assertEqual(list(Comment.objects.order_by('pk').values_list('text', flat=True)), ["Top", "Other"])
+        self.assertEqual(self.reload(top)[0].reply_count, 0)
+        self.assertEqual(self.approved_count(), 2)
+
+    def test_bulk_remove_takes_replies_and_their_counts(self):
+        top = self.comment("Top")
+        reply = self.comment("Reply", top)
+        nested = self.comment("Nested", reply)
+        self.comment("Sibling", top)
+        self.comment("Other")
+        # Removing a comment and one of its own replies counts the reply once
+        self.assertEqual(moderation.remove([reply.pk, nested.pk]), 2)
+        self.assertEqual(self.reload(top)[0].reply_count, 1)
+        self.assertEqual(self.approved_count(), 3)
+        self.assertEqual(RemovedComment.objects.count(), 2)
+        self.assertEqual(moderation.remove([top.pk], remember=False), 2)
+        self.assertEqual(list(Comment.objects.values_list('text', flat=True)), ["Other"])
+        self.assertEqual(self.approved_count(), 1)
+
+    def test_bulk_approve_counts_replies(self):
+        top = self.comment("Top")
+        reply = self.comment("Reply", top)
+        pending = [self.comment("Pending " + str(i), reply, approved=False).pk for i in range(2)]
+        self.assertEqual(moderation.approve(pending), 2)
+        self.assertEqual([comment.reply_count for comment in self.reload(top, reply)], [3, 2])
+        self.assertEqual(self.approved_count(), 4)
+
+
+@override_settings(BLOG_PAGE_SIZE=2)
+class PendingCommentListTest(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user('temporary', 'temporary@gmail.com', 'temporary')
+        self.first = Post.objects.create(author=self.user, title="First post", subtitle="Subtitle", text="Text")
+        self.second = Post.objects.create(author=self.user, title="Second post", subtitle="Subtitle", text="Text")
+        now = timezone.now()
+        self.pending = [Comment.objects.create(post=post, author="Author " + str(i), text="Text", created_date=now - timedelta(minutes=i))
+                        for i, post in enumerate([self.first, self.second, self.first])]
+        Comment.objects.create(post=self.second, author="Approved", text="Text", approved_comment=True)
+        self.client.login(username='temporary', password='temporary')
+
+    def tearDown(self):
+        self.client.logout()
+        self.user.delete()
+
+    def authors(self, response):
+        return [comment.author for comment in response.context['comments']]
+
+    def test_needs_login(self):
+        self.client.logout()
+        self.assertEqual(self.client.get('/blog/comments/pending/').status_code, 302)
+
+    def test_lists_pending_across_posts_newest_first(self):
+        response = self.client.get('/blog/comments/pending/')
+        self.assertEqual(self.authors(response), ["Author 0", "Author 1"])
+        self.assertContains(response, "Second post")
+        response = self.client.get(response.context['page'].next_url)
+        self.assertEqual(self.authors(response), ["Author 2"])
+        self.assertNotContains(response, "Approved")
+
+    def test_query_count_does_not_grow_with_posts(self):
+        self.client.get('/blog/comments/pending/')
+        with CaptureQueriesContext(connection) as before:
+            self.client.get('/blog/comments/pending/')
+        third = Post.objects.create(author=self.user, title="Third post", subtitle="Subtitle", text="Text")
+        Comment.objects.create(post=third, author="Newest", text="Text")
+        with CaptureQueriesContext(connection) as after:
+            response = self.client.get('/blog/comments/pending/')
+        self.assertEqual(self.authors(response), ["Newest", "Author 0"])
+        self.assertEqual(len(before), len(after))
+
+    def test_bulk_moderation_returns_to_queue(self):
+        response = self.client.post('/blog/comments/moderate/', {'action': 'approve', 'comment': [self.pending[0].pk], 'next': '/blog/comments/pending/'})
+        self.assertRedirects(response, '/blog/comments/pending/')
+        self.assertEqual(self.authors(self.client.get('/blog/comments/pending/')), ["Author 1", "Author 2"])
+
+    def test_empty_queue(self):
+        Comment.objects.filter(approved_comment=False).delete()
+        self.assertContains(self.client.get('/blog/comments/pending/'), 'No comments waiting for approval.')
+
+
+@override_settings(SPAM_MIN_EXAMPLES=3, SPAM_BATCH_SIZE=2)
+class SpamScoringTest(TestCase):
+
+    HAM = ["Great post, thanks for explaining the migration steps",
+           "I had the same problem with the template tags, this helped",
+           "Thanks, the part about keyset pagination was really clear",
+           "Nice write up on the search index, looking forward to more"]
+    SPAM = ["Cheap pills online!!! visit https://pills.example.com now",
+            "Buy cheap watches $$$ at https://pills.example.com today",
+            "Best casino bonus!!! https://casino.example.com free money",
+            "Earn money fast $$$ click https://casino.example.com now"]
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('temporary', 'temporary@gmail.com', 'temporary')
+        self.post = Post.objects.create(author=self.user, title="Spam", subtitle="Subtitle", text="Text")
+        self.post.publish()
+        for text in self.HAM:
+            Comment.objects.create(post=self.post, author="Reader", text=text, approved_comment=True)
+        RemovedComment.remember(("Spammer", text) for text in self.SPAM)
+
+    def tearDown(self):
+        self.user.delete()
+        cache.clear()
+
+    def pending(self, text, author="Someone"):
+        return Comment.objects.create(post=self.post, author=author, text=text).pk
+
+    def test_classifier_separates_ham_and_spam(self):
+        classifier = spam.train()
+        self.assertTrue(classifier.trained())
+        self.assertLess(classifier.score("Reader", "Thanks, this post really helped with pagination"), 0.05)
+        self.assertGreater(classifier.score("Spammer", "Cheap money!!! https://casino.example.com"), 0.95)
+
+    def test_untrained_classifier_scores_nothing(self):
+        RemovedComment.objects.all().delete()
+        self.pending("Cheap pills!!!")
+        self.assertEqual(spam.score_pending(), (0, 0, 0))
+        self.assertFalse(Comment.objects.filter(spam_score__isnull=False).exists())
+
+    @override_settings(SPAM_APPROVE_SCORE=0.05, SPAM_REMOVE_SCORE=0.95)
+    def test_score_pending_approves_ham_and_purges_spam(self):
+        ham = self.pending("Thanks, this post really helped with pagination", author="Reader")
+        junk = self.pending("Cheap money!!! https://casino.example.com", author="Spammer")
+        unsure = self.pending("Hello")
+        self.assertEqual(spam.score_pending(), (3, 1, 1))
+        self.assertTrue(Comment.objects.get(pk=ham).approved_comment)
+        self.assertFalse(Comment.objects.filter(pk=junk).exists())
+        self.assertIsNotNone(Comment.objects.get(pk=unsure, approved_comment=False).spam_score)
+        self.assertEqual(Post.objects.get(pk=self.post.pk).approved_comment_count, 5)
+        # Auto-purged spam isn't learned from, scored comments aren't scored again
+        self.assertEqual(RemovedComment.objects.count(), 4)
+        self.assertEqual(spam.score_pending(), (0, 0, 0))
+
+    def test_batches_use_a_fixed_number_of_queries(self):
+        classifier = spam.train()
+        for i in range(2):
+            self.pending("Hello " + str(i))
+        with CaptureQueriesContext(connection) as two:
+            spam.score_pending(classifier)
+        for i in range(4):
+            self.pending("Hello again " + str(i))
+        with CaptureQueriesContext(connection) as four:
+            spam.score_pending(classifier)
+        # One more read and one more UPDATE per extra batch
+        self.assertEqual(len(four) - len(two), 2)
+
+    def test_moderator_removals_are_remembered(self):
+        pk = self.pending("Visit my site")
+        self.client.login(username='temporary', password='temporary')
+        self.client.get('/blog/comment/' + str(pk) + '/remove/')
+        self.client.post('/blog/comments/moderate/', {'action': 'remove', 'comment': [self.pending("Another one")]})
+        self.client.logout()
+        self.assertEqual(RemovedComment.objects.filter(text__in=["Visit my site", "Another one"]).count(), 2)
+
+    def test_command_reports_counts(self):
+        self.pending("Hello")
+        out = StringIO()
+        call_command('score_comments', stdout=out)
+        self.assertIn('Scored 1 comments', out.getvalue())
+
+
+@override_settings(RATE_LIMIT_ENABLED=True, RATE_LIMIT_CLIENT_HEADER='HTTP_X_REAL_IP',
+                   RATE_LIMITS={'comment': {'client': (2, 60), 'global': (3, 60)}, 'write': {'client': (1, 60), 'global': (10, 60)}})
+class RateLimitTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('temporary', 'temporary@gmail.com', 'temporary')
+        self.post = Post.objects.create(author=self.user, title="Limited", subtitle="Subtitle", text="Text")
+        self.url = '/blog/post/' + str(self.post.pk) + '/comment/'
+
+    def tearDown(self):
+        self.user.delete()
+        cache.clear()
+
+    def comment(self, text, address='10.0.0.1'):
+        return self.client.post(self.url, {'author': "Reader", 'text': text}, HTTP_X_REAL_IP=address)
+
+    def test_client_over_limit_gets_429_without_queries(self):
+        self.assertEqual(self.comment("One").status_code, 302)
+        self.assertEqual(self.comment("Two").status_code, 302)
+        with self.assertNumQueries(0):
+            response = self.comment("Three")
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response['Retry-After'], '30')
+        self.assertEqual(Comment.objects.count(), 2)
+        # Showing the form is not counted
+        self.assertEqual(self.client.get(self.url, HTTP_X_REAL_IP='10.0.0.1').status_code, 200)
+
+    def test_global_bucket_is_shared_by_clients(self):
+        self.assertEqual(self.comment("One", '10.0.0.1').status_code, 302)
+        self.assertEqual(self.comment("Two", '10.0.0.2').status_code, 302)
+        self.assertEqual(self.comment("Three", '10.0.0.3').status_code, 302)
+        self.assertEqual(self.comment("Four", '10.0.0.4').status_code, 429)
+
+    def test_buckets_refill_over_time(self):
+        now = 1000000.0
+        self.assertEqual(ratelimit.take('comment', 'a', now), 0)
+        self.assertEqual(ratelimit.take('comment', 'a', now), 0)
+        self.assertEqual(ratelimit.take('comment', 'a', now + 15), 15)
+        # A refused request takes nothing from the global bucket
+        self.assertEqual(ratelimit.take('comment', 'b', now + 15), 0)
+        self.assertEqual(ratelimit.take('comment', 'a', now + 30), 0)
+        # The global bucket had half a token left, which takes ten seconds to fill
+        self.assertEqual(ratelimit.take('comment', 'c', now + 30), 10)
+        self.assertEqual(ratelimit.take('comment', 'c', now + 40), 0)
+
+    def test_anonymous_requests_do_not_spend_write_budget(self):
+        for i in range(20):
+            response = self.client.get('/blog/post/' + str(self.post.pk) + '/publish/', REMOTE_ADDR='10.0.1.' + str(i))
+            self.assertEqual(response.status_code, 302)
+        self.client.login(username='temporary', password='temporary')
+        self.assertEqual(self.client.post('/blog/post/new/', {'title': "", 'text': ""}).status_code, 200)
+        self.assertEqual(self.client.post('/blog/post/new/', {'title': "", 'text': ""}).status_code, 429)
+        self.client.logout()
+
+    @override_settings(RATE_LIMIT_CLIENT_HEADER=None)
+    def test_client_header_is_ignored_unless_configured(self):
+        self.assertEqual(self.comment("One", '10.0.0.1').status_code, 302)
+        self.assertEqual(self.comment("Two", '10.0.0.2').status_code, 302)
+        # Both came from the test client's REMOTE_ADDR
+        self.assertEqual(self.comment("Three", '10.0.0.3').status_code, 429)
@@ -1,15 +1,28 @@
 from django.urls import path
-from . import views
+from . import views, feeds, api
 
 urlpatterns = [
     path('', views.post_list, name='post_list'),
+    path('<int:year>/<int:month>/', views.post_archive, name='post_archive'),
+    path('tag/<slug:slug>/', views.tag_detail, name='tag_detail'),
+    path('search/', views.post_search, name='post_search'),
+    path('feed/rss/', feeds.rss_feed, name='rss_feed'),
+    path('feed/atom/', feeds.atom_feed, name='atom_feed'),
+    path('api/posts/', api.post_list, name='api_post_list'),
+    path('api/posts/<int:pk>/', api.post_detail, name='api_post_detail'),
+    path('api/posts/<int:pk>/comments/', api.post_comments, name='api_post_comments'),
     path('post/<int:pk>/', views.post_detail, name='post_detail'),
     path('post/new/', views.post_new, name='post_new'),
     path('post/<int:pk>/edit/', views.post_edit, name='post_edit'),
     path('drafts/', views.post_draft_list, name='post_draft_list'),
     path('post/<pk>/publish/', views.post_publish, name='post_publish'),
     path('post/<pk>/remove/', views.post_remove, name='post_remove'),
+    path('post/<int:pk>/comments/', views.post_comments, name='post_comments'),
     path('post/<int:pk>/comment/', views.add_comment_to_post, name='add_comment_to_post'),
     path('comment/<int:pk>/approve/', views.comment_approve, name='comment_approve'),
     path('comment/<int:pk>/remove/', views.comment_remove, name='comment_remove'),
+    path('comments/moderate/', views.comment_moderate, name='comment_moderate'),
+    path('comments/pending/', views.comment_pending_list, name='comment_pending_list'),
+    path('comments/queue/', views.comment_queue_stats, name='comment_queue_stats'),
+    path('render-cache/', views.render_cache_stats, name='render_cache_stats'),
 ]
\ No newline at end of file
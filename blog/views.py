@@ -1,23 +1,155 @@
+import datetime
+import re
+
+from django.conf import settings
+from django.http import Http404, JsonResponse
+from django.utils.http import is_safe_url
+from django.views.decorators.http import require_POST
 from django.shortcuts import render
 from django.utils import timezone
 from django.shortcuts import render, get_object_or_404, redirect
 
 from django.contrib.auth.decorators import login_required
 
-from .models import Post, Comment
+from mysite.conditional import conditional_for_anonymous
+from mysite.pagecache import cache_for_anonymous
+from mysite.ratelimit import rate_limit
+
+from django.db.models import Prefetch, prefetch_related_objects
+
+from .models import Post, Comment, MonthlyArchive, Tag, PostTag, RemovedComment
 from .forms import PostForm, CommentForm
+from .ingest import comment_queue
+from .pagination import paginate, paginate_threads, add_link_header
+from . import moderation, rendering, schedule, search
 
 # Create your views here.
 
+# Columns the post_list and post_draft_list cards display
+CARD_FIELDS = ('title', 'subtitle', 'excerpt', 'reading_time', 'created_date', 'published_date', 'approved_comment_count')
+
+# Columns the moderation queue displays, the post's title coming from the same query
+PENDING_FIELDS = ('author', 'text', 'created_date', 'spam_score', 'depth', 'post__title')
+
+# Ids as typed in a form or query string: ASCII digits, short enough for
+# SQLite's INTEGER
+ID = re.compile(r'[0-9]{1,18}')
+
+def parse_id(value):
+    return int(value) if ID.fullmatch(value) else None
+
+def published_posts():
+    return Post.objects.published()
+
+def post_list_changed(request, **kwargs):
+    return schedule.last_changed('blog.Post', 'blog.Comment')
+
+def post_changed(request, pk):
+    post = Post.objects.filter(pk=pk).only('updated_date', 'comments_updated_date').first()
+    return post.last_changed() if post else None
+
+def card_tags():
+    # Loads every card's tags in one extra query rather than one per post
+    return Prefetch('tags', queryset=Tag.objects.only('name', 'slug'))
+
+def card_posts(posts):
+    return posts.only(*CARD_FIELDS).prefetch_related(card_tags())
+
+def archive_months():
+    # Months with at least one post, for the archive sidebar
+    return MonthlyArchive.objects.filter(count__gt=0)
+
+def tag_cloud():
+    # The most used tags, alphabetically, sized by their stored counts
+    tags = sorted(Tag.objects.filter(post_count__gt=0).order_by('-post_count')[:settings.TAG_CLOUD_SIZE], key=lambda tag: tag.name.lower())
+    most = max([tag.post_count for tag in tags], default=1)
+    for tag in tags:
+        tag.font_size = 80 + 40 * tag.post_count // most
+    return tags
+
+def sidebar():
+    return {'archive_months': archive_months(), 'tag_cloud': tag_cloud()}
+
+@conditional_for_anonymous(post_list_changed)
+@cache_for_anonymous('posts')
 def post_list(request):
-    posts = Post.objects.filter(published_date__lte=timezone.now()).order_by('-published_date')
-    return render(request, 'post_list.html', {'posts': posts})
+    posts = card_posts(published_posts())
+    page = paginate(request, posts, 'published_date')
+    response = render(request, 'post_list.html', dict(sidebar(), posts=page, page=page))
+    return add_link_header(response, request, page)
+
+@conditional_for_anonymous(post_list_changed)
+@cache_for_anonymous('posts')
+def post_archive(request, year, month):
+    try:
+        start = timezone.make_aware(datetime.datetime(year, month, 1))
+        end = timezone.make_aware(datetime.datetime(year + month // 12, month % 12 + 1, 1))
+    except (ValueError, OverflowError):
+        raise Http404("No such month")
+    posts = card_posts(published_posts().filter(published_date__gte=start, published_date__lt=end))
+    page = paginate(request, posts, 'published_date')
+    response = render(request, 'post_archive.html', dict(sidebar(), posts=page, page=page, month=start))
+    return add_link_header(response, request, page)
 
+@conditional_for_anonymous(post_list_changed)
+@cache_for_anonymous('posts')
+def tag_detail(request, slug):
+    tag = get_object_or_404(Tag, slug=slug)
+    # Page through the tag's links on their own (tag, published_date) index,
+    # then pick up each linked post by primary key in the same query.
+    links = (PostTag.objects.filter(tag=tag, published_date__lte=timezone.now()).select_related('post')
+             .only('published_date', *['post__' + field for field in CARD_FIELDS]))
+    page = paginate(request, links, 'published_date')
+    page.object_list = [link.post for link in page]
+    prefetch_related_objects(page.object_list, card_tags())
+    response = render(request, 'tag_detail.html', dict(sidebar(), posts=page, page=page, tag=tag))
+    return add_link_header(response, request, page)
+
+def visible_comments(request, post):
+    # Anonymous readers never see pending comments, so don't load them.
+    if request.user.is_authenticated:
+        return post.comments.all()
+    return post.approved_comments()
+
+def comment_page(request, post):
+    # A page of threads with all their replies, in one query
+    return paginate_threads(request, visible_comments(request, post), settings.COMMENTS_PAGE_SIZE)
+
+def reply_parent(post, pk):
+    # Replies go under approved comments only, so every approved comment's
+    # thread is visible, and no deeper than COMMENT_MAX_DEPTH: a reply to a
+    # comment that deep becomes its sibling.
+    if not pk:
+        return None
+    pk = parse_id(pk)
+    if pk is None:
+        raise Http404("No such comment")
+    parent = get_object_or_404(Comment.objects.only('author', 'parent', 'depth'), pk=pk, post=post, approved_comment=True)
+    if parent.depth >= settings.COMMENT_MAX_DEPTH:
+        parent = Comment.objects.only('author', 'parent', 'depth').get(pk=parent.parent_id)
+    return parent
+
+@conditional_for_anonymous(post_changed)
+@cache_for_anonymous('post:{pk}')
 def post_detail(request, pk):
     post = get_object_or_404(Post, pk=pk)
-    return render(request, 'post_detail.html', {'post': post})
+    comments = comment_page(request, post)
+    return render(request, 'post_detail.html', {'post': post, 'comments': comments, 'related': post.related_posts()})
+
+@cache_for_anonymous('post:{pk}')
+def post_comments(request, pk):
+    post = get_object_or_404(Post, pk=pk)
+    comments = comment_page(request, post)
+    return render(request, 'includes/comments.html', {'post': post, 'comments': comments})
+
+def post_search(request):
+    query = request.GET.get('q', '').strip()
+    page = search.search(request, query, CARD_FIELDS)
+    response = render(request, 'post_search.html', {'query': query, 'posts': page, 'page': page})
+    return add_link_header(response, request, page)
 
 @login_required
+@rate_limit('write')
 def post_new(request):
     if request.method == "POST":
         form = PostForm(request.POST)
@@ -25,12 +157,14 @@ def post_new(request):
             post = form.save(commit=False)
             post.author = request.user
             post.save()
+            form.save_m2m()
             return redirect('post_detail', pk=post.pk)
     else:
         form = PostForm()
     return render(request, 'post_edit.html', {'form': form})
 
 @login_required
+@rate_limit('write')
 def post_edit(request, pk):
     post = get_object_or_404(Post, pk=pk)
     if request.method == "POST":
@@ -39,6 +173,7 @@ def post_edit(request, pk):
             post = form.save(commit=False)
             post.author = request.user
             post.save()
+            form.save_m2m()
             return redirect('post_detail', pk=post.pk)
     else:
         form = PostForm(instance=post)
@@ -46,42 +181,89 @@ def post_edit(request, pk):
 
 @login_required
 def post_draft_list(request):
-    posts = Post.objects.filter(published_date__isnull=True).order_by('-created_date')
-    return render(request, 'post_draft_list.html', {'posts': posts})
+    posts = Post.objects.filter(published_date__isnull=True).only(*CARD_FIELDS)
+    page = paginate(request, posts, 'created_date')
+    scheduled = Post.objects.filter(published_date__gt=timezone.now()).only('title', 'published_date').order_by('published_date')
+    response = render(request, 'post_draft_list.html', {'posts': page, 'page': page, 'scheduled': scheduled})
+    return add_link_header(response, request, page)
 
 @login_required
+@rate_limit('write', methods=('GET', 'POST'))
 def post_publish(request, pk):
     post = get_object_or_404(Post, pk=pk)
     post.publish()
     return redirect('post_detail', pk=pk)
 
 @login_required
+@rate_limit('write', methods=('GET', 'POST'))
 def post_remove(request, pk):
     post = get_object_or_404(Post, pk=pk)
     post.delete()
     return redirect('post_list')
 
+@rate_limit('comment')
 def add_comment_to_post(request, pk):
     post = get_object_or_404(Post, pk=pk)
+    parent = reply_parent(post, request.GET.get('reply_to'))
     if request.method == "POST":
         form = CommentForm(request.POST)
         if form.is_valid():
-            comment = form.save(commit=False)
-            comment.post = post
-            comment.save()
+            # Written in the next batch, see blog/ingest.py
+            comment_queue.submit(post.pk, form.cleaned_data['author'], form.cleaned_data['text'], parent)
             return redirect('post_detail', pk=post.pk)
     else:
         form = CommentForm()
-    return render(request, 'add_comment.html', {'form': form})
+    return render(request, 'add_comment.html', {'form': form, 'parent': parent})
 
 @login_required
+@rate_limit('write', methods=('GET', 'POST'))
 def comment_approve(request, pk):
     comment = get_object_or_404(Comment, pk=pk)
     comment.approve()
-    return redirect('post_detail', pk=comment.post.pk)
+    return redirect('post_detail', pk=comment.post_id)
 
 @login_required
+@rate_limit('write', methods=('GET', 'POST'))
 def comment_remove(request, pk):
     comment = get_object_or_404(Comment, pk=pk)
+    RemovedComment.remember([(comment.author, comment.text)])
     comment.delete()
-    return redirect('post_detail', pk=comment.post.pk)
\ No newline at end of file
+    return redirect('post_detail', pk=comment.post_id)
+
+@login_required
+@rate_limit('write')
+@require_POST
+def comment_moderate(request):
+    # Approves or removes every comment ticked in one go
+    pks = [parse_id(pk) for pk in request.POST.getlist('comment')]
+    if None in pks:
+        return JsonResponse({'error': 'comment must be comment ids'}, status=400)
+    action = request.POST.get('action')
+    if action == 'approve':
+        result = {'approved': moderation.approve(pks)}
+    elif action == 'remove':
+        result = {'removed': moderation.remove(pks)}
+    else:
+        return JsonResponse({'error': 'action must be approve or remove'}, status=400)
+    next_url = request.POST.get('next')
+    if next_url and is_safe_url(next_url, allowed_hosts={request.get_host()}, require_https=request.is_secure()):
+        return redirect(next_url)
+    return JsonResponse(result)
+
+@login_required
+def comment_pending_list(request):
+    # Pending comments on every post, newest first
+    comments = Comment.objects.filter(approved_comment=False).select_related('post').only(*PENDING_FIELDS)
+    page = paginate(request, comments, 'created_date')
+    response = render(request, 'comment_pending_list.html', {'comments': page, 'page': page})
+    return add_link_header(response, request, page)
+
+@login_required
+def comment_queue_stats(request):
+    # This worker's comment queue: depth, totals and the last flush's size and duration
+    return JsonResponse(comment_queue.stats())
+
+@login_required
+def render_cache_stats(request):
+    # This worker's Markdown render cache: size, hits, misses and evictions
+    return JsonResponse(rendering.render_cache.stats())
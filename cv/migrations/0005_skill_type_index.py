@@ -0,0 +1,17 @@
+# Generated by Django 2.2.28 on 2026-10-18 06:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cv', '0004_interest'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='skill',
+            index=models.Index(fields=['skill_type'], name='cv_skill_type_idx'),
+        ),
+    ]
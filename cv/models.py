@@ -21,6 +21,11 @@ class Skill(models.Model):
     title = models.CharField(max_length=200)
     skill_type = models.CharField(max_length=10, choices=TYPE_CHOICES, default='technical')
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['skill_type'], name='cv_skill_type_idx'),
+        ]
+
     def __str__(self):
         return self.title + " " + self.skill_type
 
@@ -0,0 +1,18 @@
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from home.models import LastChange
+from mysite.pagecache import invalidate
+
+from .models import Education, Skill, Experience, Interest
+
+CV_MODELS = (Education, Skill, Experience, Interest)
+
+
+@receiver([post_save, post_delete], sender=Education)
+@receiver([post_save, post_delete], sender=Skill)
+@receiver([post_save, post_delete], sender=Experience)
+@receiver([post_save, post_delete], sender=Interest)
+def invalidate_cv_pages(sender, instance, **kwargs):
+    LastChange.touch(sender._meta.label)
+    invalidate('cv')
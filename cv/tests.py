@@ -1,5 +1,6 @@
 from django.urls import resolve
-from django.test import TestCase
+from django.test import TestCase, override_settings
+from django.core.cache import cache
 from django.http import HttpRequest
 from django.contrib.auth.models import User
 
@@ -946,3 +947,47 @@ class AuthenticationTest(TestCase):
         self.assertIn('class="btn btn-outline-dark delete_btn"', html) 
         self.client.logout()
 
+
+
+@override_settings(PAGE_CACHE_TIMEOUT=60)
+class CvPageCacheTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+
+    def tearDown(self):
+        cache.clear()
+
+    def test_cv_served_from_cache(self):
+        self.client.get('/cv/')
+        with self.assertNumQueries(1):
+            self.assertTemplateNotUsed(self.client.get('/cv/'), 'cv/cv.html')
+
+    def test_cv_changes_invalidate_cv_only(self):
+        self.client.get('/cv/')
+        self.client.get('/blog/')
+        for item in (Skill(title="Cached Skill"), Interest(title="Cached Interest")):
+            item.save()
+            self.assertContains(self.client.get('/cv/'), item.title)
+        Interest.objects.get(title="Cached Interest").delete()
+        self.assertNotContains(self.client.get('/cv/'), "Cached Interest")
+        with self.assertNumQueries(1):
+            self.client.get('/blog/')
+
+
+class CvConditionalGetTest(TestCase):
+
+    def test_cv_not_modified_until_cv_changes(self):
+        Interest.objects.create(title="Interest")
+        response = self.client.get('/cv/')
+        response2 = self.client.get('/cv/', HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response2.status_code, 304)
+        self.assertTemplateNotUsed(response2, 'cv/cv.html')
+        Skill.objects.create(title="New Skill")
+        self.assertEqual(self.client.get('/cv/', HTTP_IF_NONE_MATCH=response['ETag']).status_code, 200)
+
+    def test_deleting_cv_item_changes_etag(self):
+        item = Education.objects.create(title="Title", location="Location", start_date="2000", end_date="2001", brief_text="Brief", detailed_text="Detail")
+        etag = self.client.get('/cv/')['ETag']
+        item.delete()
+        self.assertEqual(self.client.get('/cv/', HTTP_IF_NONE_MATCH=etag).status_code, 200)
@@ -2,12 +2,23 @@
 from django.shortcuts import render, get_object_or_404, redirect
 
 from django.contrib.auth.decorators import login_required
+
+from home.models import LastChange
+from mysite.conditional import conditional_for_anonymous
+from mysite.pagecache import cache_for_anonymous
+from mysite.ratelimit import rate_limit
 from .models import Education, Skill, Experience, Interest
+from .signals import CV_MODELS
 from .forms import EducationForm, SkillForm, ExperienceForm, InterestForm
 
 
 # Create your views here.
 
+def cv_changed(request):
+    return LastChange.latest(*[model._meta.label for model in CV_MODELS])
+
+@conditional_for_anonymous(cv_changed)
+@cache_for_anonymous('cv')
 def show_cv(request):
     education = Education.objects.all()
     tech_skills = Skill.objects.filter(skill_type__exact="technical")
@@ -17,6 +28,7 @@ def show_cv(request):
     return render(request, 'cv/cv.html', {'education': education, 'tech_skills':tech_skills, 'other_skills':other_skills, 'experience':experience, 'interests':interests})
 
 @login_required
+@rate_limit('write')
 def education_new(request):
     if request.method == "POST":
         form = EducationForm(request.POST)
@@ -29,6 +41,7 @@ def education_new(request):
     return render(request, 'cv/education_edit.html', {'form': form})
 
 @login_required
+@rate_limit('write')
 def education_edit(request, pk):
     education = get_object_or_404(Education, pk=pk)
     if request.method == "POST":
@@ -42,6 +55,7 @@ def education_edit(request, pk):
     return render(request, 'cv/education_edit.html', {'form': form})
 
 @login_required
+@rate_limit('write', methods=('GET', 'POST'))
 def education_remove(request, pk):
     item = get_object_or_404(Education, pk=pk)
     item.delete()
@@ -49,6 +63,7 @@ def education_remove(request, pk):
 
 
 @login_required
+@rate_limit('write')
 def skill_new(request):
     if request.method == "POST":
         form = SkillForm(request.POST)
@@ -61,6 +76,7 @@ def skill_new(request):
     return render(request, 'cv/skill_edit.html', {'form': form})
 
 @login_required
+@rate_limit('write')
 def skill_edit(request, pk):
     skill = get_object_or_404(Skill, pk=pk)
     if request.method == "POST":
@@ -74,12 +90,14 @@ def skill_edit(request, pk):
     return render(request, 'cv/skill_edit.html', {'form': form})
 
 @login_required
+@rate_limit('write', methods=('GET', 'POST'))
 def skill_remove(request, pk):
     item = get_object_or_404(Skill, pk=pk)
     item.delete()
     return redirect('/cv/')
 
 @login_required
+@rate_limit('write')
 def experience_new(request):
     if request.method == "POST":
         form = ExperienceForm(request.POST)
@@ -92,6 +110,7 @@ def experience_new(request):
     return render(request, 'cv/experience_edit.html', {'form': form})
 
 @login_required
+@rate_limit('write')
 def experience_edit(request, pk):
     experience = get_object_or_404(Experience, pk=pk)
     if request.method == "POST":
@@ -105,12 +124,14 @@ def experience_edit(request, pk):
     return render(request, 'cv/experience_edit.html', {'form': form})
 
 @login_required
+@rate_limit('write', methods=('GET', 'POST'))
 def experience_remove(request, pk):
     item = get_object_or_404(Experience, pk=pk)
     item.delete()
     return redirect('/cv/')
 
 @login_required
+@rate_limit('write')
 def interest_new(request):
     if request.method == "POST":
         form = InterestForm(request.POST)
@@ -123,6 +144,7 @@ def interest_new(request):
     return render(request, 'cv/interest_edit.html', {'form': form})
 
 @login_required
+@rate_limit('write')
 def interest_edit(request, pk):
     interest = get_object_or_404(Interest, pk=pk)
     if request.method == "POST":
@@ -136,6 +158,7 @@ def interest_edit(request, pk):
     return render(request, 'cv/interest_edit.html', {'form': form})
 
 @login_required
+@rate_limit('write', methods=('GET', 'POST'))
 def interest_remove(request, pk):
     item = get_object_or_404(Interest, pk=pk)
     item.delete()
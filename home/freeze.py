@@ -0,0 +1,131 @@
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from django.db import connections
+from django.test import Client, RequestFactory
+
+from blog.pagination import paginate
+from blog.views import published_posts, archive_months, tag_cloud, CARD_FIELDS
+from cv.signals import CV_MODELS
+from home.models import LastChange
+
+# Static export ("freeze") of the pages anonymous readers see.
+#
+# Every public URL is rendered through the normal URL conf into a file under
+# the output directory. Pages at /path/ are written to path/index.html, and
+# cursor pages of the blog index (/blog/?cursor=X) to blog/cursor-X.html, so
+# the web server needs a rule to serve those when ?cursor= is present and to
+# pass anything it has no file for (search, comment fragments, forms) on to
+# Django.
+#
+# A manifest in the output directory records, for every page, the rows that
+# fed it and when each last changed. Later runs only re-render pages whose
+# inputs differ from the manifest, and remove pages that no longer exist.
+
+MANIFEST = '.freeze-manifest.json'
+
+
+def stamp(value):
+    return value.isoformat() if value else ''
+
+
+def output_file(url):
+    path, _, query = url.partition('?cursor=')
+    path = path.strip('/')
+    name = 'cursor-%s.html' % query if query else 'index.html'
+    return os.path.join(path, name) if path else name
+
+
+def public_pages():
+    """Returns {url: dependencies} for every page the export covers."""
+    pages = {'/': {}}
+    cv_changed = LastChange.latest(*[model._meta.label for model in CV_MODELS])
+    pages['/cv/'] = {'cv': stamp(cv_changed)}
+
+    posts = published_posts().only(*CARD_FIELDS + ('updated_date', 'comments_updated_date'))
+    # Every blog index page carries the archive sidebar and the tag cloud
+    archive = ' '.join('%s:%s' % (month, month.count) for month in archive_months())
+    tags = ' '.join('%s:%s' % (tag.slug, tag.post_count) for tag in tag_cloud())
+    factory = RequestFactory()
+    cursor = None
+    while True:
+        request = factory.get('/blog/', {'cursor': cursor} if cursor else {})
+        page = paginate(request, posts, 'published_date')
+        deps = {}
+        for post in page:
+            deps['blog.Post:%s' % post.pk] = stamp(post.last_changed())
+            pages['/blog/post/%s/' % post.pk] = {'blog.Post:%s' % post.pk: stamp(post.last_changed())}
+        # The pager links embed the neighbouring pages' boundaries
+        deps['next'] = page.next_cursor or ''
+        deps['previous'] = page.previous_cursor or ''
+        deps['archive'] = archive
+        deps['tags'] = tags
+        pages['/blog/?cursor=%s' % cursor if cursor else '/blog/'] = deps
+        if not page.has_next():
+            break
+        cursor = page.next_cursor
+    return pages
+
+
+def close_connections():
+    # Forked workers must not share the parent's database connection
+    connections.close_all()
+
+
+def render_page(url, output_dir):
+    response = Client(HTTP_HOST='localhost').get(url)
+    if response.status_code != 200:
+        return url, response.status_code
+    path = os.path.join(output_dir, output_file(url))
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path + '.tmp', 'wb') as f:
+        f.write(response.content)
+    os.replace(path + '.tmp', path)
+    return url, response.status_code
+
+
+def load_manifest(output_dir):
+    try:
+        with open(os.path.join(output_dir, MANIFEST)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_manifest(output_dir, manifest):
+    path = os.path.join(output_dir, MANIFEST)
+    with open(path + '.tmp', 'w') as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    os.replace(path + '.tmp', path)
+
+
+def freeze(output_dir, workers=1, force=False):
+    """Brings output_dir up to date and returns (rendered, skipped, removed, failed) URLs."""
+    os.makedirs(output_dir, exist_ok=True)
+    old = load_manifest(output_dir)
+    pages = public_pages()
+
+    stale = [url for url, deps in pages.items()
+             if force or old.get(url) != deps or not os.path.exists(os.path.join(output_dir, output_file(url)))]
+    skipped = [url for url in pages if url not in stale]
+
+    if workers > 1 and len(stale) > 1:
+        close_connections()
+        with ProcessPoolExecutor(max_workers=workers, initializer=close_connections) as pool:
+            results = list(pool.map(render_page, stale, [output_dir] * len(stale), chunksize=16))
+    else:
+        results = [render_page(url, output_dir) for url in stale]
+
+    failed = [url for url, status in results if status != 200]
+    rendered = [url for url, status in results if status == 200]
+    manifest = {url: pages[url] for url in skipped + rendered}
+
+    removed = [url for url in old if url not in pages]
+    for url in removed:
+        path = os.path.join(output_dir, output_file(url))
+        if os.path.exists(path):
+            os.remove(path)
+
+    save_manifest(output_dir, manifest)
+    return rendered, skipped, removed, failed
@@ -0,0 +1,20 @@
+import os
+
+from django.core.management.base import BaseCommand
+
+from home.freeze import freeze
+
+
+class Command(BaseCommand):
+    help = 'Renders every public page into a directory of static HTML, re-rendering only pages whose data changed'
+
+    def add_arguments(self, parser):
+        parser.add_argument('output_dir')
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='Number of processes to render with')
+        parser.add_argument('--force', action='store_true', help='Re-render every page, e.g. after a template change')
+
+    def handle(self, *args, **options):
+        rendered, skipped, removed, failed = freeze(options['output_dir'], options['workers'], options['force'])
+        for url in failed:
+            self.stderr.write('Failed to render %s' % url)
+        self.stdout.write('Rendered %d pages, %d unchanged, %d removed' % (len(rendered), len(skipped), len(removed)))
@@ -0,0 +1,22 @@
+# Generated by Django 2.2.28 on 2026-10-18 06:28
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LastChange',
+            fields=[
+                ('key', models.CharField(max_length=100, primary_key=True, serialize=False)),
+                ('changed_date', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+        ),
+    ]
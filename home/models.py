@@ -1,3 +1,26 @@
 from django.db import models
+from django.db.models import Max
+from django.utils import timezone
 
 # Create your models here.
+
+class LastChange(models.Model):
+    # One row per model, stamped whenever a row of that model is saved or
+    # deleted. Reading the latest stamp for a page's models is a cheap way
+    # to tell whether the page could have changed.
+    key = models.CharField(max_length=100, primary_key=True)
+    changed_date = models.DateTimeField(default=timezone.now)
+
+    @classmethod
+    def touch(cls, *keys):
+        now = timezone.now()
+        for key in keys:
+            if not cls.objects.filter(key=key).update(changed_date=now):
+                cls.objects.get_or_create(key=key, defaults={'changed_date': now})
+
+    @classmethod
+    def latest(cls, *keys):
+        return cls.objects.filter(key__in=keys).aggregate(latest=Max('changed_date'))['latest']
+
+    def __str__(self):
+        return self.key
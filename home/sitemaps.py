@@ -0,0 +1,74 @@
+from django.conf import settings
+from django.db.models import ExpressionWrapper, F, IntegerField, Max
+from django.shortcuts import render
+from django.urls import reverse
+
+from blog import schedule
+from blog.models import Post
+from cv.signals import CV_MODELS
+from home.models import LastChange
+from mysite.conditional import conditional_for_anonymous
+from mysite.pagecache import cache_for_anonymous
+
+# sitemap.xml is an index of one static section (home, CV and blog index)
+# and of post chunks. Post chunk n holds the published posts whose pk lies
+# in [n * SITEMAP_CHUNK_SIZE, (n + 1) * SITEMAP_CHUNK_SIZE), so a chunk never
+# exceeds the 50,000 URL limit and a changed post only expires its own chunk.
+
+
+def chunk_of(pk):
+    return pk // settings.SITEMAP_CHUNK_SIZE
+
+
+def blog_changed():
+    return schedule.last_changed('blog.Post', 'blog.Comment')
+
+
+def cv_changed():
+    return LastChange.latest(*[model._meta.label for model in CV_MODELS])
+
+
+def sitemap_changed(request, **kwargs):
+    return max(filter(None, [blog_changed(), cv_changed()]), default=None)
+
+
+def post_chunk_changed(request, chunk):
+    # LastChange is site wide, so any post change revalidates every chunk,
+    # but only the changed post's chunk is re-rendered from the database.
+    return blog_changed()
+
+
+@conditional_for_anonymous(sitemap_changed)
+@cache_for_anonymous('posts', 'cv')
+def sitemap_index(request):
+    size = settings.SITEMAP_CHUNK_SIZE
+    chunks = (Post.objects.published().order_by()
+              .annotate(chunk=ExpressionWrapper(F('pk') / size, output_field=IntegerField()))
+              .values('chunk').annotate(updated=Max('updated_date'), commented=Max('comments_updated_date')).order_by('chunk'))
+    sitemaps = [{'location': request.build_absolute_uri(reverse('sitemap_static')), 'lastmod': sitemap_changed(request)}]
+    for chunk in chunks:
+        lastmod = max(filter(None, [chunk['updated'], chunk['commented']]))
+        sitemaps.append({'location': request.build_absolute_uri(reverse('sitemap_posts', kwargs={'chunk': chunk['chunk']})), 'lastmod': lastmod})
+    return render(request, 'sitemap_index.xml', {'sitemaps': sitemaps}, content_type='application/xml')
+
+
+@conditional_for_anonymous(sitemap_changed)
+@cache_for_anonymous('posts', 'cv')
+def sitemap_static(request):
+    urls = [
+        {'location': request.build_absolute_uri(reverse('home')), 'lastmod': None},
+        {'location': request.build_absolute_uri(reverse('cv')), 'lastmod': cv_changed()},
+        {'location': request.build_absolute_uri(reverse('post_list')), 'lastmod': blog_changed()},
+    ]
+    return render(request, 'sitemap.xml', {'urls': urls}, content_type='application/xml')
+
+
+@conditional_for_anonymous(post_chunk_changed)
+@cache_for_anonymous('sitemap-posts:{chunk}')
+def sitemap_posts(request, chunk):
+    size = settings.SITEMAP_CHUNK_SIZE
+    posts = (Post.objects.published().filter(pk__gte=chunk * size, pk__lt=(chunk + 1) * size)
+             .only('updated_date', 'comments_updated_date').order_by('pk'))
+    urls = [{'location': request.build_absolute_uri(reverse('post_detail', kwargs={'pk': post.pk})), 'lastmod': post.last_changed()}
+            for post in posts.iterator()]
+    return render(request, 'sitemap.xml', {'urls': urls}, content_type='application/xml')
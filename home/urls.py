@@ -1,6 +1,9 @@
 from django.urls import path
-from . import views
+from . import views, sitemaps
 
 urlpatterns = [
     path('', views.home, name='home'),
+    path('sitemap.xml', sitemaps.sitemap_index, name='sitemap_index'),
+    path('sitemap-static.xml', sitemaps.sitemap_static, name='sitemap_static'),
+    path('sitemap-posts-<int:chunk>.xml', sitemaps.sitemap_posts, name='sitemap_posts'),
 ]
\ No newline at end of file
@@ -1,5 +1,8 @@
 from django.shortcuts import render
 
+from mysite.pagecache import cache_for_anonymous
+
 # Create your views here.
+@cache_for_anonymous()
 def home(request):
     return render(request, 'home.html')
\ No newline at end of file
@@ -0,0 +1,38 @@
+import hashlib
+from calendar import timegm
+from functools import wraps
+
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+
+
+def conditional_for_anonymous(last_changed):
+    """Answers anonymous GETs with 304 when nothing on the page has changed.
+
+    last_changed(request, **kwargs) returns when the data behind the page
+    last changed, or None if that can't be told. Both the ETag and the
+    Last-Modified header come from it, and a matching request is answered
+    before the view runs, so no template is rendered.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            user = getattr(request, 'user', None)
+            if request.method not in ('GET', 'HEAD') or user is None or user.is_authenticated:
+                return view(request, *args, **kwargs)
+
+            changed = last_changed(request, *args, **kwargs)
+            if changed is None:
+                return view(request, *args, **kwargs)
+
+            etag = quote_etag(hashlib.sha1((request.get_full_path() + '|' + changed.isoformat()).encode()).hexdigest())
+            last_modified = timegm(changed.utctimetuple())
+            response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+            if response is None:
+                response = view(request, *args, **kwargs)
+            if response.status_code in (200, 304):
+                response['ETag'] = etag
+                response['Last-Modified'] = http_date(last_modified)
+            return response
+        return wrapper
+    return decorator
@@ -0,0 +1,106 @@
+import hashlib
+import math
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.utils import timezone
+
+# Whole-page cache for anonymous GET requests.
+#
+# Each cached page is tagged with the namespaces it depends on, such as
+# 'posts' or 'post:12'. Every namespace has a generation counter in the
+# cache, and the page's cache key includes the current generation of each
+# of its namespaces. Invalidating a namespace bumps its counter, so every
+# page tagged with it misses from then on while other pages stay cached.
+#
+# Pages that go stale at a time known in advance, rather than on a write,
+# register an expiry for their namespace and are cached only until then.
+
+GENERATION_KEY = 'pagecache:gen:%s'
+PAGE_KEY = 'pagecache:page:%s'
+
+# {namespace prefix: callable returning the datetime its pages go stale, or None}
+_expiries = {}
+
+
+def get_cache():
+    return caches[settings.PAGE_CACHE_ALIAS]
+
+
+def generations(namespaces):
+    cache = get_cache()
+    keys = [GENERATION_KEY % namespace for namespace in namespaces]
+    found = cache.get_many(keys)
+    for key in keys:
+        if key not in found:
+            # Seed with the clock rather than 1 so a counter that was evicted
+            # never comes back with a value an older page was cached under.
+            cache.add(key, int(time.time() * 1000000), None)
+            found[key] = cache.get(key)
+    return [found[key] for key in keys]
+
+
+def page_key(request, namespaces):
+    parts = [request.build_absolute_uri()] + ['%s=%s' % pair for pair in zip(namespaces, generations(namespaces))]
+    return PAGE_KEY % hashlib.sha1('|'.join(parts).encode()).hexdigest()
+
+
+def bump(namespaces):
+    cache = get_cache()
+    for namespace in namespaces:
+        try:
+            cache.incr(GENERATION_KEY % namespace)
+        except ValueError:
+            # No page has been cached under this namespace yet
+            pass
+
+
+def expire_at(prefix, when):
+    """Caches pages tagged with a namespace starting prefix (up to any ':')
+    no later than when() returns, e.g. expire_at('posts', next_publish_time).
+    """
+    _expiries[prefix] = when
+
+
+def page_timeout(tags):
+    timeout = settings.PAGE_CACHE_TIMEOUT
+    for prefix in {tag.split(':')[0] for tag in tags}:
+        when = _expiries[prefix]() if prefix in _expiries else None
+        if when is not None:
+            timeout = min(timeout, max(1, math.ceil((when - timezone.now()).total_seconds())))
+    return timeout
+
+
+def invalidate(*namespaces):
+    # Bump now so this process stops serving the old pages, and again after
+    # commit in case another request cached the pre-commit data in between.
+    bump(namespaces)
+    transaction.on_commit(lambda: bump(namespaces))
+
+
+def cache_for_anonymous(*namespaces):
+    """Caches a view's response for anonymous GETs, tagged with namespaces.
+
+    Namespaces are format strings filled in from the view's keyword
+    arguments, so 'post:{pk}' tags a post's page with its own namespace.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            user = getattr(request, 'user', None)
+            if not settings.PAGE_CACHE_TIMEOUT or request.method != 'GET' or user is None or user.is_authenticated:
+                return view(request, *args, **kwargs)
+
+            tags = [namespace.format(**kwargs) for namespace in namespaces]
+            key = page_key(request, tags)
+            response = get_cache().get(key)
+            if response is None:
+                response = view(request, *args, **kwargs)
+                if response.status_code == 200 and not response.cookies and not getattr(response, 'streaming', False):
+                    get_cache().set(key, response, page_timeout(tags))
+            return response
+        return wrapper
+    return decorator
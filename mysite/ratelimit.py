@@ -0,0 +1,93 @@
+import math
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import caches
+from django.http import HttpResponse
+
+# Token-bucket rate limiting for write views.
+#
+# Each scope in settings.RATE_LIMITS has a bucket per client and one shared
+# by every client, both kept in the page cache backend so all workers spend
+# from the same budget. A bucket holds up to `tokens` tokens and refills at
+# `tokens` per `seconds`; a request takes one token from each. A request
+# finding either bucket empty is answered with 429 and Retry-After before
+# the view runs. On the anonymous comment form that costs one cache read
+# and no database work; on logged in views only @login_required's session
+# lookup comes first.
+#
+# Buckets are read and written back without a lock, so requests arriving at
+# the same moment may spend the same token: the limit can be overshot by
+# the number of simultaneous requests, never more.
+
+BUCKET_KEY = 'ratelimit:%s:%s'
+
+
+def client_id(request):
+    # The address, not request.user, which would load the session and the
+    # user from the database. A header is only trusted when the front-end
+    # proxy is configured to set it.
+    header = settings.RATE_LIMIT_CLIENT_HEADER
+    return (request.META.get(header) if header else None) or request.META.get('REMOTE_ADDR', '')
+
+
+def refill(bucket, tokens, seconds, now):
+    """Returns the tokens a (tokens, timestamp) bucket holds now; a missing bucket is full."""
+    if bucket is None:
+        return tokens
+    held, then = bucket
+    return min(tokens, held + (now - then) * tokens / seconds)
+
+
+def take(scope, client, now=None):
+    """Takes a token from the scope's buckets for client.
+
+    Returns 0 if the request may go ahead, otherwise the seconds until it
+    could. Nothing is taken from either bucket when one of them is empty.
+    """
+    limits = settings.RATE_LIMITS[scope]
+    now = time.time() if now is None else now
+    buckets = [(BUCKET_KEY % (scope, client), limits['client']), (BUCKET_KEY % (scope, '*'), limits['global'])]
+    cache = caches[settings.PAGE_CACHE_ALIAS]
+    found = cache.get_many([key for key, limit in buckets])
+
+    held = {}
+    wait = 0
+    for key, (tokens, seconds) in buckets:
+        held[key] = refill(found.get(key), tokens, seconds, now)
+        if held[key] < 1:
+            wait = max(wait, (1 - held[key]) * seconds / tokens)
+    if wait:
+        return wait
+
+    for key, (tokens, seconds) in buckets:
+        # Kept until the bucket would have refilled anyway
+        cache.set(key, (held[key] - 1, now), math.ceil(seconds))
+    return 0
+
+
+def too_many_requests(wait):
+    response = HttpResponse('Too many requests, please try again later.\n', status=429, content_type='text/plain')
+    response['Retry-After'] = str(math.ceil(wait))
+    return response
+
+
+def rate_limit(scope, methods=('POST',)):
+    """Answers requests over the scope's limits with 429 before the view runs.
+
+    Only requests using one of methods are counted, so showing a form is
+    free while submitting it is not. On views for logged in users put it
+    below @login_required, so anonymous requests are turned away before
+    they can spend the budget of the people allowed to write.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if settings.RATE_LIMIT_ENABLED and request.method in methods:
+                wait = take(scope, client_id(request))
+                if wait:
+                    return too_many_requests(wait)
+            return view(request, *args, **kwargs)
+        return wrapper
+    return decorator
@@ -11,6 +11,7 @@ https://docs.djangoproject.com/en/2.2/ref/settings/
 """
 
 import os
+import sys
 
 # Build paths inside the project like this: os.path.join(BASE_DIR, ...)
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
@@ -84,6 +85,28 @@ DATABASES = {
 }
 
 
+# Cache
+# https://docs.djangoproject.com/en/2.2/topics/cache/
+
+# The page cache and its generation counters (mysite/pagecache.py), the
+# rate limit buckets (mysite/ratelimit.py), the comment dedup keys
+# (blog/ingest.py) and the publishing schedule (blog/schedule.py) all live
+# here, and only work if every web worker and cron command sees the same
+# cache. Files on local disk are shared by all of them without another
+# service to run. The test suite runs in one process and uses memory.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.path.join(BASE_DIR, 'cache'),
+        'OPTIONS': {
+            'MAX_ENTRIES': 10000,
+        },
+    }
+}
+if 'test' in sys.argv:
+    CACHES['default'] = {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}
+
+
 # Password validation
 # https://docs.djangoproject.com/en/2.2/ref/settings/#auth-password-validators
 
@@ -122,4 +145,70 @@ USE_TZ = True
 
 STATIC_URL = '/static/'
 STATIC_ROOT = os.path.join(BASE_DIR, 'static')
-LOGIN_REDIRECT_URL = '/'
\ No newline at end of file
+LOGIN_REDIRECT_URL = '/'
+
+# Number of posts per page on the blog index and drafts list
+BLOG_PAGE_SIZE = 10
+
+# Most tags shown in the blog's tag cloud
+TAG_CLOUD_SIZE = 50
+
+# Number of related posts stored and shown for each post
+RELATED_POSTS_COUNT = 5
+
+# Number of posts in the RSS and Atom feeds
+FEED_ITEM_COUNT = 20
+
+# Most post URLs in one sitemap file (the sitemap protocol allows 50,000)
+SITEMAP_CHUNK_SIZE = 50000
+
+# Number of top-level comments loaded at a time on a post's page, each
+# with all its replies
+COMMENTS_PAGE_SIZE = 50
+
+# Deepest level of comment replies, top-level comments being level 0
+COMMENT_MAX_DEPTH = 4
+
+# Write-behind queue for new comments (see blog/ingest.py): seconds between
+# writes, most comments per write, and how long a repeated comment is
+# dropped for. Comments are written at once while the test suite runs,
+# because the test database can't be shared with the writer thread.
+COMMENT_QUEUE_INTERVAL = 0 if 'test' in sys.argv else 2
+COMMENT_QUEUE_BATCH = 500
+COMMENT_DEDUP_SECONDS = 60
+
+# Spam scoring of pending comments (see blog/spam.py): comments scoring at
+# most SPAM_APPROVE_SCORE are approved and those scoring at least
+# SPAM_REMOVE_SCORE deleted. Nothing is scored until there are
+# SPAM_MIN_EXAMPLES approved and removed comments to learn from, and at most
+# SPAM_TRAINING_SIZE of the latest of each are used.
+SPAM_APPROVE_SCORE = 0.01
+SPAM_REMOVE_SCORE = 0.99
+SPAM_MIN_EXAMPLES = 20
+SPAM_TRAINING_SIZE = 5000
+SPAM_BATCH_SIZE = 500
+
+# Token buckets for write views (see mysite/ratelimit.py): per scope, how
+# many requests one client and all clients together may make, as (tokens,
+# seconds) refilled evenly over that many seconds. Clients are told apart
+# by REMOTE_ADDR, or by the META key RATE_LIMIT_CLIENT_HEADER names if set.
+# Only set it to a header the front-end proxy always overwrites with the
+# client's address (on PythonAnywhere, 'HTTP_X_REAL_IP'), as clients can
+# send any header they like. Off while the test suite runs, because the
+# buckets outlive each test in the cache.
+RATE_LIMITS = {
+    'comment': {'client': (5, 60), 'global': (120, 60)},
+    'write': {'client': (60, 60), 'global': (300, 60)},
+}
+RATE_LIMIT_CLIENT_HEADER = None
+RATE_LIMIT_ENABLED = 'test' not in sys.argv
+
+# Size cap for the in-process cache behind the markdown template filter.
+# Each worker's hits, misses and evictions are at /blog/render-cache/
+# (logged in), to size it by.
+MARKDOWN_CACHE_BYTES = 4 * 1024 * 1024
+
+# Anonymous page cache (see mysite/pagecache.py). It is switched off while
+# the test suite runs, because test rollbacks don't invalidate it.
+PAGE_CACHE_ALIAS = 'default'
+PAGE_CACHE_TIMEOUT = 0 if 'test' in sys.argv else 60 * 60